@@ -0,0 +1,39 @@
+"""
+Streaming NDJSON export of the whole catalog
+"""
+
+import json
+import zlib
+from typing import Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+
+# rows fetched from the Postgres server-side cursor per round trip
+EXPORT_CHUNK_SIZE = 2_000
+# bytes collected before a chunk is handed to the client
+EXPORT_FLUSH_SIZE = 64 * 1024
+
+
+def ndjson_stream(queryset: QuerySet, compress: bool = False) -> Iterator[bytes]:
+    """
+    Yield `queryset` rows as NDJSON, one JSON document per line,
+    optionally as a single gzip stream.
+    `QuerySet.iterator` reads from a server-side cursor, so memory does not grow with the catalog.
+    """
+    # wbits=31 makes zlib write gzip header and trailer
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = bytearray()
+    for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        buffer += json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
+        buffer += b'\n'
+        if len(buffer) >= EXPORT_FLUSH_SIZE:
+            chunk = compressor.compress(bytes(buffer)) if compressor else bytes(buffer)
+            buffer.clear()
+            if chunk:
+                yield chunk
+    tail = bytes(buffer)
+    if compressor:
+        tail = compressor.compress(tail) + compressor.flush()
+    if tail:
+        yield tail
@@ -0,0 +1,135 @@
+"""
+Full-text search over the `movies` index that the ETL keeps in sync with Postgres
+"""
+
+import hashlib
+import logging
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from django.core.cache import caches
+from elasticsearch import Elasticsearch
+
+from etl.es import get_es_client
+
+logger = logging.getLogger(__name__)
+
+MOVIES_INDEX = 'movies'
+PERSONS_INDEX = 'persons'
+# title matches weigh more than matches in long descriptions or person lists
+SEARCH_FIELDS = ['title^3', 'description', 'actors_names', 'writers_names', 'directors_names']
+# ElasticSearch document field -> API field, same names as the list API uses
+SOURCE_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'description': 'description',
+    'imdb_rating': 'rating',
+    'genres_names': 'genres',
+    'actors_names': 'actors',
+    'directors_names': 'directors',
+    'writers_names': 'writers',
+}
+# default `index.max_result_window`: ElasticSearch refuses to page deeper
+MAX_RESULT_WINDOW = 10_000
+
+
+@lru_cache(maxsize=None)
+def es_client() -> Elasticsearch:
+    """One client per process; it is thread-safe and keeps its connection pool"""
+    return get_es_client()
+
+
+def _query(q: str) -> dict:
+    return {'multi_match': {'query': q, 'fields': SEARCH_FIELDS}}
+
+
+def _cache_key(*parts) -> str:
+    # normalise the query, so `Star  Wars` and `star wars` share one cache entry
+    raw = '|'.join(' '.join(str(part).lower().split()) for part in parts)
+    return 'search:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def count_movies(q: str) -> int:
+    """Number of films matching `q`"""
+    key = _cache_key('count', q)
+    count = caches['search'].get(key)
+    if count is None:
+        count = es_client().count(index=MOVIES_INDEX, body={'query': _query(q)})['count']
+        caches['search'].set(key, count)
+    return count
+
+
+def search_movies(q: str, page: int, page_size: int) -> Optional[Tuple[int, List[dict]]]:
+    """
+    Total number of hits and one page of films in the API format, best matches first.
+    None if the page is deeper than ElasticSearch can serve.
+    Results of hot queries are served from the `search` cache.
+    """
+    offset = (page - 1) * page_size
+    if offset + page_size > MAX_RESULT_WINDOW:
+        return None
+    key = _cache_key(q, page, page_size)
+    result = caches['search'].get(key)
+    if result is not None:
+        return result
+
+    body = {
+        'query': _query(q),
+        'from': offset,
+        'size': page_size,
+        '_source': list(SOURCE_FIELDS),
+        'track_total_hits': True,
+    }
+    response = es_client().search(index=MOVIES_INDEX, body=body)
+    movies = [{SOURCE_FIELDS[field]: hit['_source'].get(field) for field in SOURCE_FIELDS}
+              for hit in response['hits']['hits']]
+    result = response['hits']['total']['value'], movies
+    caches['search'].set(key, result)
+    return result
+
+
+def suggest(prefix: str, size: int) -> dict:
+    """
+    Type-ahead over film titles and person names from the `completion` fields built by the ETL.
+    Both indexes are asked in one `msearch` round trip.
+    """
+    key = _cache_key('suggest', prefix, size)
+    result = caches['search'].get(key)
+    if result is not None:
+        return result
+
+    def completion(field: str, source: List[str]) -> dict:
+        return {
+            '_source': source,
+            'suggest': {
+                field: {
+                    'prefix': prefix,
+                    'completion': {'field': field, 'size': size, 'skip_duplicates': True},
+                },
+            },
+        }
+
+    body = [
+        {'index': MOVIES_INDEX}, completion('title_suggest', ['id', 'title']),
+        {'index': PERSONS_INDEX}, completion('name_suggest', ['id', 'full_name']),
+    ]
+    titles, persons = es_client().msearch(body=body)['responses']
+    result = {
+        'titles': _options(titles, 'title_suggest'),
+        'persons': _options(persons, 'name_suggest'),
+    }
+    if result['titles'] is not None and result['persons'] is not None:
+        caches['search'].set(key, result)
+    # an index not built yet has no suggestions, the other one is still served
+    return {kind: options or [] for kind, options in result.items()}
+
+
+def _options(response: dict, field: str) -> Optional[List[dict]]:
+    """
+    Suggestions from one `msearch` response, None if it failed: `msearch` answers 200
+    even when an index is missing or has no completion mapping
+    """
+    if 'error' in response:
+        logger.warning(f'Suggestions from {field} failed: {response["error"]}')
+        return None
+    return [option['_source'] for option in response['suggest'][field][0]['options']]
@@ -4,5 +4,8 @@ from api.v1 import views
 
 urlpatterns = [
     path('movies/', views.MoviesListApi.as_view()),
-    path('movies/<uuid:id>', views.MoviesDetailView.as_view())
+    path('movies/export', views.MoviesExportView.as_view()),
+    path('movies/search', views.MoviesSearchApi.as_view()),
+    path('movies/<uuid:id>', views.MoviesDetailView.as_view()),
+    path('suggest', views.SuggestApi.as_view()),
 ]
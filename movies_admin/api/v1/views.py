@@ -1,13 +1,25 @@
-from django.contrib.postgres.aggregates import ArrayAgg
-from django.db.models import F, Q, QuerySet
-from django.http import Http404, JsonResponse
+import math
+import uuid
+from typing import List
+
+from django.core.exceptions import BadRequest
+from django.db.models import Exists, F, OuterRef, QuerySet
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.generic import View
 from django.views.generic.detail import BaseDetailView
 from django.views.generic.list import BaseListView
 from django.utils.translation import gettext as _
+from elasticsearch import TransportError
 
-from movies.models import FilmWork, PersonJob
+from api.v1.export import ndjson_stream
+from api.v1.search import count_movies, search_movies, suggest
+from config.routers import replica_reads
+from movies.expressions import ArraySubquery
+from movies.models import FilmWork, FilmWorkGenre, FilmWorkPerson, FilmWorkType, PersonJob
 
 PAGE_SIZE = 50
+SUGGEST_SIZE = 10
 
 
 class MoviesApiMixin:
@@ -15,28 +27,140 @@ class MoviesApiMixin:
     model = FilmWork
     http_method_names = ['get']
 
+    # API field name -> FilmWork field name; these are read straight from `film_work`
+    scalar_fields = {
+        'id': 'id',
+        'title': 'title',
+        'description': 'description',
+        'creation_date': 'creation_date',
+        'rating': 'imdb_rating',
+        'type': 'film_type',
+    }
+    # could have copy 3 times, but we may extend `job` number later
+    array_fields = ['genres'] + [job + 's' for job in PersonJob.values]  # like actors, writers and so on
+
+    def dispatch(self, request, *args, **kwargs):
+        # the API tolerates replication lag, unlike the admin
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
     def render_to_response(self, context) -> JsonResponse:
         return JsonResponse(context)
 
+    def get_fields(self) -> List[str]:
+        """
+        Fields requested with `?fields=title,rating,...`; all fields if the parameter is absent.
+        Lets clients skip the costly genre and person arrays.
+        """
+        return self.parse_fields(','.join(self.request.GET.getlist('fields')))
+
+    @classmethod
+    def parse_fields(cls, requested: str) -> List[str]:
+        """Validate comma-separated field names; `id` is always returned"""
+        all_fields = list(cls.scalar_fields) + cls.array_fields
+        if not requested:
+            return all_fields
+        fields = ['id'] + [field.strip() for field in requested.split(',') if field.strip()]
+        unknown = set(fields) - set(all_fields)
+        if unknown:
+            raise BadRequest(_('Unknown fields: %s') % ', '.join(sorted(unknown)))
+        # keep the documented order of fields whatever order was requested
+        return [field for field in all_fields if field in fields]
+
+    def get_base_queryset(self) -> QuerySet:
+        """
+        FilmWorks to return, without any of the API fields.
+        Filters on relations are `EXISTS` subqueries: they never multiply rows,
+        so the filtered query needs neither DISTINCT nor GROUP BY
+        """
+        qs = self.model.objects.all()
+        params = self.request.GET
+
+        genre = params.get('genre')
+        if genre:
+            genres = FilmWorkGenre.objects.filter(film_work=OuterRef('pk'), genre_id=self._parse_uuid('genre', genre))
+            qs = qs.filter(Exists(genres))
+
+        person, job = params.get('person'), params.get('job')
+        if job and job not in PersonJob.values:
+            raise BadRequest(_('Unknown job: %s') % job)
+        if person or job:
+            persons = FilmWorkPerson.objects.filter(film_work=OuterRef('pk'))
+            if person:
+                persons = persons.filter(person_id=self._parse_uuid('person', person))
+            if job:
+                persons = persons.filter(job=job)
+            qs = qs.filter(Exists(persons))
+
+        film_type = params.get('type')
+        if film_type:
+            if film_type not in FilmWorkType.values:
+                raise BadRequest(_('Unknown type: %s') % film_type)
+            qs = qs.filter(film_type=film_type)
+
+        rating_min, rating_max = params.get('rating_min'), params.get('rating_max')
+        if rating_min:
+            qs = qs.filter(imdb_rating__gte=self._parse_float('rating_min', rating_min))
+        if rating_max:
+            qs = qs.filter(imdb_rating__lte=self._parse_float('rating_max', rating_max))
+        return qs
+
+    @staticmethod
+    def _parse_uuid(name: str, value: str) -> uuid.UUID:
+        try:
+            return uuid.UUID(value)
+        except ValueError:
+            raise BadRequest(_('%s must be a UUID.') % name)
+
+    @staticmethod
+    def _parse_float(name: str, value: str) -> float:
+        try:
+            return float(value)
+        except ValueError:
+            raise BadRequest(_('%s must be a number.') % name)
+
     def get_queryset(self) -> QuerySet:
         # look how we just do it in 2 SQL queries!
         # get queryset for all FilmWorks
-        qs = self.model.objects.all().order_by('title')
+        qs = self.get_base_queryset().order_by('title')
+        return self.annotate_fields(qs, self.get_fields())
+
+    @classmethod
+    def annotate_fields(cls, qs: QuerySet, fields: List[str]) -> QuerySet:
+        """Turn FilmWork queryset into dicts holding API `fields`"""
         # get queryset for fields with same names as API specification requires
-        qs = qs.values('id', 'title', 'description', 'creation_date')
+        qs = qs.values(*[field for field in fields if cls.scalar_fields.get(field) == field])
         # add renamed fields; this does not require additional queries to DB
-        qs = qs.annotate(rating=F('imdb_rating'))
-        qs = qs.annotate(type=F('film_type'))
-        # add genres
-        qs = qs.annotate(genres=ArrayAgg('genres__genre', distinct=True))
-        # add persons
-        # could have copy 3 times, but we may extend `job` number later
+        for field in fields:
+            if field in cls.scalar_fields and cls.scalar_fields[field] != field:
+                qs = qs.annotate(**{field: F(cls.scalar_fields[field])})
+        # every array below is a separate correlated subquery over its own m2m table,
+        # so genres and persons are never joined with each other (no genres × persons fan-out)
+        # and the outer query needs no GROUP BY;
+        # arrays that were not requested are not in SQL at all
+        if 'genres' in fields:
+            qs = qs.annotate(genres=cls.genres_subquery())
         for job in PersonJob.values:
-            jobs_list = job + 's'  # like actors_list, writers_list and so on
-            kwarg = {jobs_list: ArrayAgg('persons__name', distinct=True, filter=Q(filmworkperson__job=job))}
-            qs = qs.annotate(**kwarg)
+            jobs_list = job + 's'
+            if jobs_list in fields:
+                qs = qs.annotate(**{jobs_list: cls.persons_subquery(job)})
         return qs
 
+    @staticmethod
+    def genres_subquery() -> ArraySubquery:
+        """Sorted distinct genre names of the outer FilmWork"""
+        genres = FilmWorkGenre.objects.filter(film_work=OuterRef('pk'))
+        # DISTINCT ON instead of plain DISTINCT: Django drops ORDER BY of the latter in subqueries
+        genres = genres.values_list('genre__genre').order_by('genre__genre').distinct('genre__genre')
+        return ArraySubquery(genres)
+
+    @staticmethod
+    def persons_subquery(job: str) -> ArraySubquery:
+        """Sorted distinct names of persons having `job` in the outer FilmWork"""
+        persons = FilmWorkPerson.objects.filter(film_work=OuterRef('pk'), job=job)
+        persons = persons.values_list('person__name').order_by('person__name').distinct('person__name')
+        return ArraySubquery(persons)
+
 
 class MoviesListApi(MoviesApiMixin, BaseListView):
     """Paginated list view for filmworks"""
@@ -51,6 +175,9 @@ class MoviesListApi(MoviesApiMixin, BaseListView):
 
     def paginate_queryset(self, queryset, page_size) -> dict:
         paginator = self.get_paginator(queryset, page_size)
+        # Django 3.2 keeps every annotation in the COUNT(*) subquery and so would build
+        # all the arrays for the whole catalog; they never change the number of rows
+        paginator.count = self.get_base_queryset().count()
 
         page = self.request.GET.get('page', 1)
         try:
@@ -84,3 +211,84 @@ class MoviesDetailView(MoviesApiMixin, BaseDetailView):
     def get_context_data(self, **kwargs):
         context = self.object
         return context
+
+
+class MoviesExportView(MoviesApiMixin, View):
+    """
+    The whole catalog as a stream of NDJSON documents,
+    gzip-compressed if the client accepts it.
+    Replaces paging through the list API with a single sequential scan.
+    """
+
+    def get(self, request, *args, **kwargs) -> StreamingHttpResponse:
+        # no ORDER BY: let Postgres read `film_work` sequentially
+        qs = self.annotate_fields(self.get_base_queryset(), self.get_fields())
+        # the stream is read after `dispatch` has returned, pin the database while it is routed
+        qs = qs.using(qs.db)
+        compress = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        response = StreamingHttpResponse(ndjson_stream(qs, compress), content_type='application/x-ndjson')
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # stream through nginx instead of buffering the whole export
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class MoviesSearchApi(View):
+    """
+    Paginated full-text search over the ElasticSearch `movies` index:
+    titles, descriptions and person names. Postgres is not queried at all.
+    """
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs) -> JsonResponse:
+        q = request.GET.get('q', '').strip()
+        if not q:
+            raise BadRequest(_('Search query `q` is required.'))
+
+        try:
+            page_num = self._get_page_num(q)
+            found = search_movies(q, page_num, PAGE_SIZE)
+            if found is None:
+                raise Http404(_('Page is too deep, refine the search query.'))
+            count, result = found
+            total_pages = max(math.ceil(count / PAGE_SIZE), 1)
+            if page_num > total_pages:
+                # same as the list API: pages after the last one return the last page
+                page_num = total_pages
+                count, result = search_movies(q, page_num, PAGE_SIZE)
+        except TransportError:  # unavailable cluster, missing index or failed request
+            return JsonResponse({'detail': _('Search is temporarily unavailable.')}, status=503)
+
+        context = {
+            'count': count,
+            'total_pages': total_pages,
+            'prev': page_num - 1 if page_num > 1 else None,
+            'next': page_num + 1 if page_num < total_pages else None,
+            'result': result,
+        }
+        return JsonResponse(context)
+
+    def _get_page_num(self, q: str) -> int:
+        page = self.request.GET.get('page', 1)
+        try:
+            return max(int(page), 1)
+        except ValueError:
+            if page == 'last':
+                return max(math.ceil(count_movies(q) / PAGE_SIZE), 1)
+            raise Http404(_('Page is not “last”, nor can it be converted to an int.'))
+
+
+class SuggestApi(View):
+    """Autocomplete of film titles and person names for `?q=` prefix"""
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs) -> JsonResponse:
+        q = request.GET.get('q', '').strip()
+        if not q:
+            raise BadRequest(_('Search query `q` is required.'))
+        try:
+            return JsonResponse(suggest(q, SUGGEST_SIZE))
+        except TransportError:  # unavailable cluster, missing index or failed request
+            return JsonResponse({'detail': _('Search is temporarily unavailable.')}, status=503)
@@ -0,0 +1,66 @@
+"""
+Routing of reads to the optional `replica` database.
+
+Reads go to the replica only inside `replica_reads()`: the ETL extraction and the API use it,
+the admin keeps reading its own writes from the primary. Writes always go to the primary.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def has_replica() -> bool:
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def replica_reads(enabled: bool = True):
+    """Send the reads inside the block to the replica, if one is configured"""
+    token = _read_alias.set(REPLICA_DB_ALIAS if enabled and has_replica() else None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def wait_for_replica(timeout: float, poll: float = 0.05) -> bool:
+    """
+    Wait until the replica has replayed everything committed on the primary so far.
+    False if it is still behind after `timeout` seconds
+    """
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute('SELECT pg_current_wal_lsn()')
+        watermark = cursor.fetchone()[0]
+    deadline = time.monotonic() + timeout
+    while True:
+        with connections[REPLICA_DB_ALIAS].cursor() as cursor:
+            # NULL if the "replica" is not in recovery, i.e. is a primary itself
+            cursor.execute('SELECT coalesce(pg_last_wal_replay_lsn() >= %s::pg_lsn, true)', [watermark])
+            if cursor.fetchone()[0]:
+                return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(poll)
@@ -1,7 +1,4 @@
 import os
-from pathlib import Path
-
-BASE_DIR = Path(__file__).resolve(strict=True).parent.parent.parent
 
 SECRET_KEY = os.getenv('SECRET_KEY', None)
 
@@ -57,39 +54,27 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
-# Database setup
-POSTGRES_USER = os.getenv('POSTGRES_USER', None)
-POSTGRES_PASSWORD = os.getenv('POSTGRES_PASSWORD', None)
-
-if POSTGRES_USER is None:
-    raise Exception('Postgres user is not set. Provide POSTGRES_USER environment variable')
-if POSTGRES_PASSWORD is None:
-    raise Exception('Postgres password is not set. Provide POSTGRES_PASSWORD environment variable')
+# Postgres, ElasticSearch and ETL setup, shared with the standalone ETL runner
+from .services import *
 
-POSTGRES_HOST = os.getenv('POSTGRES_HOST', 'localhost')
-POSTGRES_PORT = os.getenv('POSTGRES_PORT', '5432')
+# API full-text search: results of hot queries are cached in-process for a short time
+SEARCH_CACHE_TIMEOUT = int(os.getenv('SEARCH_CACHE_TIMEOUT', 60))
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', 1_000))
 
-
-DATABASES = {
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
-        'NAME': 'movies',
-        'USER': POSTGRES_USER,
-        'PASSWORD': POSTGRES_PASSWORD,
-        'HOST': POSTGRES_HOST,
-        'PORT': POSTGRES_PORT,
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'search',
+        'TIMEOUT': SEARCH_CACHE_TIMEOUT,
         'OPTIONS': {
-               'options': '-c search_path=content'
-        }
-    }
+            'MAX_ENTRIES': SEARCH_CACHE_SIZE,
+        },
+    },
 }
 
-# ElasticSearch setup
-ES_HOST = os.getenv('ES_HOST', 'elastic_search')
-ES_PORT = os.getenv('ES_PORT', 9200)
-ES_MAX_RECONNECTIONS = os.getenv('ES_MAX_RECONNECTIONS', 10)
-ETL_BATCH_SIZE = os.getenv('ETL_BATCH_SIZE', 50)
-
 
 AUTH_PASSWORD_VALIDATORS = [
     {
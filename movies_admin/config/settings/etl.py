@@ -0,0 +1,40 @@
+"""
+Minimal settings of the standalone ETL runner (`run_etl.py`):
+only the ORM models and the `etl` app, no admin, auth, sessions or web settings
+"""
+
+import os
+
+from .services import *
+
+# the ETL signs nothing, but Django refuses to start without a key
+SECRET_KEY = os.getenv('SECRET_KEY', 'etl-runner')
+
+INSTALLED_APPS = [
+    'movies',
+    'etl',
+]
+
+TIME_ZONE = 'Europe/Moscow'
+
+USE_TZ = True
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'default': {
+            'format': '%(asctime)s %(levelname)s: %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'default',
+        },
+    },
+    'root': {
+        'level': os.getenv('ETL_LOG_LEVEL', 'INFO'),
+        'handlers': ['console'],
+    },
+}
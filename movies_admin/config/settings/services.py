@@ -0,0 +1,92 @@
+"""
+Settings of the services used by both the web project and the standalone ETL runner
+"""
+
+import os
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve(strict=True).parent.parent.parent
+
+# Database setup
+POSTGRES_USER = os.getenv('POSTGRES_USER', None)
+POSTGRES_PASSWORD = os.getenv('POSTGRES_PASSWORD', None)
+
+if POSTGRES_USER is None:
+    raise Exception('Postgres user is not set. Provide POSTGRES_USER environment variable')
+if POSTGRES_PASSWORD is None:
+    raise Exception('Postgres password is not set. Provide POSTGRES_PASSWORD environment variable')
+
+POSTGRES_HOST = os.getenv('POSTGRES_HOST', 'localhost')
+POSTGRES_PORT = os.getenv('POSTGRES_PORT', '5432')
+
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'NAME': 'movies',
+        'USER': POSTGRES_USER,
+        'PASSWORD': POSTGRES_PASSWORD,
+        'HOST': POSTGRES_HOST,
+        'PORT': POSTGRES_PORT,
+        'OPTIONS': {
+               'options': '-c search_path=content'
+        }
+    }
+}
+
+# Optional streaming replica of the same database: ETL extraction and API reads go there,
+# all writes and the admin stay on `default`, see `config.routers`
+POSTGRES_REPLICA_HOST = os.getenv('POSTGRES_REPLICA_HOST')
+if POSTGRES_REPLICA_HOST:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': POSTGRES_REPLICA_HOST,
+        'PORT': os.getenv('POSTGRES_REPLICA_PORT', POSTGRES_PORT),
+    }
+DATABASE_ROUTERS = ['config.routers.ReplicaRouter']
+# seconds the ETL waits for the replica to replay the primary's changes before reading the primary instead
+ETL_REPLICA_MAX_WAIT = float(os.getenv('ETL_REPLICA_MAX_WAIT', 5))
+
+# ElasticSearch setup
+ES_HOST = os.getenv('ES_HOST', 'elastic_search')
+ES_PORT = os.getenv('ES_PORT', 9200)
+ES_MAX_RECONNECTIONS = int(os.getenv('ES_MAX_RECONNECTIONS', 10))
+# uncompressed size limit of one bulk request body and its gzip level
+ETL_BULK_MAX_BYTES = int(os.getenv('ETL_BULK_MAX_BYTES', 5 * 1024 * 1024))
+ETL_BULK_COMPRESS_LEVEL = int(os.getenv('ETL_BULK_COMPRESS_LEVEL', 3))
+# caps of the bulk load rate, lowered automatically under backpressure (see `etl.throttle`); 0 disables a cap.
+# An incremental run shares the cluster with live search, a full rebuild is allowed to go faster
+ETL_BULK_LIMITS = {
+    'incremental': {
+        'docs_per_second': float(os.getenv('ETL_BULK_DOCS_PER_SECOND', 2_000)),
+        'bytes_per_second': float(os.getenv('ETL_BULK_BYTES_PER_SECOND', 4 * 1024 * 1024)),
+    },
+    'rebuild': {
+        'docs_per_second': float(os.getenv('ETL_REBUILD_DOCS_PER_SECOND', 10_000)),
+        'bytes_per_second': float(os.getenv('ETL_REBUILD_BYTES_PER_SECOND', 20 * 1024 * 1024)),
+    },
+}
+ETL_BATCH_SIZE = int(os.getenv('ETL_BATCH_SIZE', 50))
+# primary key ranges leased by concurrent ETL processes, more partitions than processes spread the load
+ETL_PARTITIONS = int(os.getenv('ETL_PARTITIONS', 16))
+# entities changed within the window (seconds) take the priority lane, which gets the share of batches
+ETL_PRIORITY_WINDOW = int(os.getenv('ETL_PRIORITY_WINDOW', 600))
+ETL_PRIORITY_SHARE = float(os.getenv('ETL_PRIORITY_SHARE', 0.5))
+# days to keep per-batch indexing lag statistics shown by `etl_status`
+ETL_STATS_RETENTION = int(os.getenv('ETL_STATS_RETENTION', 7))
+# a backlog over this fraction of an index's rows switches the ETL to a full rebuild (see `etl.rebuild`), 0 never;
+# the backlog is checked at start and then at most every check interval (seconds)
+ETL_REBUILD_THRESHOLD = float(os.getenv('ETL_REBUILD_THRESHOLD', 0.3))
+ETL_REBUILD_CHECK_INTERVAL = int(os.getenv('ETL_REBUILD_CHECK_INTERVAL', 60))
+ETL_REBUILD_BATCH_SIZE = int(os.getenv('ETL_REBUILD_BATCH_SIZE', 1000))
+# the rebuild watermark is moved back by this many seconds for changes committed while the scan started
+ETL_REBUILD_WATERMARK_MARGIN = int(os.getenv('ETL_REBUILD_WATERMARK_MARGIN', 60))
+# `aggregated` or `normalized`, see `etl.etl.ETL.get_updated_movies`
+ETL_MOVIES_EXTRACTION = os.getenv('ETL_MOVIES_EXTRACTION', 'aggregated')
+# persons and genres names kept in memory by the `normalized` movies extraction
+ETL_LOOKUP_CACHE_SIZE = int(os.getenv('ETL_LOOKUP_CACHE_SIZE', 100_000))
+# number of best rated films stored in every `genres` document
+ETL_GENRE_TOP_FILMS = int(os.getenv('ETL_GENRE_TOP_FILMS', 10))
+# `start_etl --spool` writes documents here, `drain_spool` loads them to ElasticSearch
+ETL_SPOOL_DIR = os.getenv('ETL_SPOOL_DIR', os.path.join(BASE_DIR, 'spool'))
+ETL_SPOOL_SEGMENT_SIZE = int(os.getenv('ETL_SPOOL_SEGMENT_SIZE', 16 * 1024 * 1024))
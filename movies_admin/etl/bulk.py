@@ -0,0 +1,148 @@
+"""
+ElasticSearch bulk requests: bounded by size, pre-encoded with orjson and sent gzip-compressed,
+with backpressure: documents rejected with 429 are resent at a lower rate, see `etl.throttle`
+"""
+
+import gzip
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+import backoff
+import orjson
+from django.conf import settings
+from elasticsearch import ConnectionError, Elasticsearch, TransportError
+from elasticsearch.helpers import BulkIndexError, expand_action
+
+from etl.throttle import BulkThrottle
+
+ES_MAX_RECONNECTIONS = settings.ES_MAX_RECONNECTIONS
+BULK_LIMITS = settings.ETL_BULK_LIMITS
+BULK_MAX_BYTES = settings.ETL_BULK_MAX_BYTES
+BULK_COMPRESS_LEVEL = settings.ETL_BULK_COMPRESS_LEVEL
+
+HEADERS = {'content-type': 'application/x-ndjson', 'content-encoding': 'gzip'}
+# documents are versioned by the time of their latest change, so ElasticSearch keeps the newest
+# whatever order the ETL and spool loaders send them in; an equal version overwrites,
+# so replayed chunks and documents requeued by `reconcile_es` are indexed again
+VERSION_TYPE = 'external_gte'
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+logger = logging.getLogger(__name__)
+
+
+class BulkStats(NamedTuple):
+    requests: int
+    raw_bytes: int
+    compressed_bytes: int
+
+
+def document_version(last_modified: datetime) -> dict:
+    """Bulk action metadata versioning a document by its `last_modified`, in microseconds"""
+    return {'_version': int(last_modified.timestamp()) * 1_000_000 + last_modified.microsecond,
+            '_version_type': VERSION_TYPE}
+
+
+def version_time(version: int) -> datetime:
+    """`last_modified` a document version was made from, see `document_version`"""
+    return EPOCH + timedelta(microseconds=version)
+
+
+def encode_action(action: dict) -> bytes:
+    """Bulk body lines of one action"""
+    meta, source = expand_action(action)
+    if source is None:
+        return orjson.dumps(meta) + b'\n'
+    return orjson.dumps(meta) + b'\n' + orjson.dumps(source) + b'\n'
+
+
+class BulkLoader:
+    """
+    Sends bulk actions in requests of at most `max_bytes` uncompressed,
+    paced by a `BulkThrottle`; `mode` picks the caps from `ETL_BULK_LIMITS`.
+    Actions ElasticSearch rejects for good (a 4xx other than 429) raise `BulkIndexError`,
+    or are handed to `dead_letter` with their bulk response items when it is set
+    """
+
+    def __init__(self, es: Elasticsearch, mode: str = 'incremental', max_bytes: int = BULK_MAX_BYTES,
+                 dead_letter: Optional[Callable[[List[Tuple[dict, dict]]], None]] = None):
+        self.es = es
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.dead_letter = dead_letter
+        self.throttle = BulkThrottle(**BULK_LIMITS[mode])
+
+    def __call__(self, actions: List[dict]) -> BulkStats:
+        """Index all `actions`, return the sizes of the requests sent"""
+        requests = raw_bytes = compressed_bytes = 0
+        for chunk, lines in self._chunks(actions):
+            for attempt in range(ES_MAX_RECONNECTIONS):
+                body = b''.join(lines)
+                compressed = gzip.compress(body, compresslevel=BULK_COMPRESS_LEVEL)
+                # the caps limit the bytes ElasticSearch parses, not the bytes on the wire
+                self.throttle.pace(len(chunk), len(body))
+                started = time.perf_counter()
+                rejected = self._send(chunk, compressed)
+                self.throttle.feedback(len(chunk), time.perf_counter() - started, len(rejected))
+                requests += 1
+                raw_bytes += len(body)
+                compressed_bytes += len(compressed)
+                if not rejected:
+                    break
+                logger.warning(f'{len(rejected)} docs rejected by ElasticSearch, '
+                               f'bulk rate lowered to {self.throttle.factor:.0%} of the {self.mode} caps')
+                if attempt + 1 < ES_MAX_RECONNECTIONS:
+                    self.throttle.backoff(attempt)
+                resend = {id(action) for action in rejected}
+                chunk, lines = zip(*[(action, line) for action, line in zip(chunk, lines) if id(action) in resend])
+            else:
+                raise BulkIndexError(f'{len(chunk)} document(s) rejected after {ES_MAX_RECONNECTIONS} attempts', [])
+        return BulkStats(requests, raw_bytes, compressed_bytes)
+
+    def _chunks(self, actions: List[dict]) -> Iterator[Tuple[List[dict], List[bytes]]]:
+        """Actions with their encoded lines, split into bodies of at most `max_bytes`"""
+        chunk, lines, size = [], [], 0
+        for action in actions:
+            line = encode_action(action)
+            if chunk and size + len(line) > self.max_bytes:
+                yield chunk, lines
+                chunk, lines, size = [], [], 0
+            chunk.append(action)
+            lines.append(line)
+            size += len(line)
+        if chunk:
+            yield chunk, lines
+
+    @backoff.on_exception(backoff.expo, ConnectionError, max_tries=ES_MAX_RECONNECTIONS)
+    def _send(self, actions: List[dict], body: bytes) -> List[dict]:
+        """
+        Send the request, return the actions rejected with 429; other failures raise,
+        except deletes of documents already gone and documents ElasticSearch has a newer version of
+        """
+        try:
+            response = self.es.transport.perform_request('POST', '/_bulk', headers=HEADERS, body=body)
+        except TransportError as e:
+            if e.status_code == 429:
+                return actions
+            raise
+        if not response['errors']:
+            return []
+        rejected, errors, failed = [], [], []
+        for action, item in zip(actions, response['items']):
+            result = next(iter(item.values()))
+            if result['status'] == 429:
+                rejected.append(action)
+            elif result['status'] == 404 and 'delete' in item:
+                continue
+            elif result['status'] == 409 and '_version' in action:
+                continue
+            elif 400 <= result['status'] < 500 and self.dead_letter:
+                failed.append((action, item))
+            elif result['status'] >= 300:
+                errors.append(item)
+        if errors:
+            raise BulkIndexError(f'{len(errors)} document(s) failed to index.', errors)
+        if failed:
+            self.dead_letter(failed)
+        return rejected
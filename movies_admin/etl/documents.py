@@ -0,0 +1,56 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class Suggest(BaseModel):
+    """Value of an ElasticSearch `completion` field"""
+    input: List[str]
+    weight: int
+
+
+class BasePerson(BaseModel):
+    id: str
+    full_name: str
+
+
+class PersonFilm(BaseModel):
+    id: str
+    title: str
+    roles: List[str]
+
+
+class Person(BasePerson):
+    films: List[PersonFilm]
+    name_suggest: Suggest
+    content_hash: str
+
+
+class BaseGenre(BaseModel):
+    id: str
+    name: str
+
+
+class Genre(BaseGenre):
+    description: str
+    film_count: int
+    avg_imdb_rating: Optional[float]
+    top_film_ids: List[str]
+    content_hash: str
+
+
+class FilmWorkES(BaseModel):
+    id: str
+    title: str
+    description: str
+    imdb_rating: Optional[float]
+    genres: List[BaseGenre]
+    genres_names: List[str]
+    writers_names: List[str]
+    actors_names: List[str]
+    directors_names: List[str]
+    writers: List[BasePerson]
+    actors: List[BasePerson]
+    directors: List[BasePerson]
+    title_suggest: Suggest
+    content_hash: str
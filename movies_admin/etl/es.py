@@ -0,0 +1,10 @@
+from django.conf import settings
+from elasticsearch import Elasticsearch
+
+
+def get_es_client() -> Elasticsearch:
+    """ElasticSearch client configured from Django settings"""
+    config = {'host': settings.ES_HOST,
+              'port': settings.ES_PORT,
+              }
+    return Elasticsearch([config, ])
@@ -1,26 +1,51 @@
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from functools import wraps
-from typing import List
+from collections import defaultdict
+from contextlib import closing, contextmanager, nullcontext
+from typing import Dict, Iterable, List, Optional
+from uuid import UUID
 
-import backoff
 from django.conf import settings
 from django.contrib.postgres.aggregates import ArrayAgg
-from django.db.models import F, Q
+from django.db.models import DateTimeField, F, Max, Model, OuterRef, Q, QuerySet, Subquery
 from django.db.models.functions import Greatest
-from elasticsearch import ConnectionError, Elasticsearch
-from elasticsearch.helpers import bulk
-from pydantic import ValidationError
-
-from etl.models import BasePerson, FilmWorkES, Genre
-from movies.models import FilmWork, Person, PersonJob
+from django.utils import timezone
+
+from config.routers import has_replica, replica_reads, wait_for_replica
+
+from etl.hashing import genre_hash, genre_stats, movie_hash, person_hash
+from etl.lanes import LaneScheduler
+from etl.leases import PartitionLeases
+from etl.profiling import StageProfiler
+from etl.rebuild import (REBUILD_LEASE, BacklogMonitor, apply_watermark, create_index, drop_index, publish_index,
+                         store_watermark)
+from etl.lookup import NameLookup
+from etl.rows import GenreRow, MovieRow, PersonRow
+from etl.spool import Spool
+from etl.stats import prune_batches, record_batch
+from movies.models import FilmWork, FilmWorkGenre, FilmWorkPerson, Person, PersonJob
 from movies import models as m
 
 ETL_BATCH_SIZE = settings.ETL_BATCH_SIZE
-ES_MAX_RECONNECTIONS = settings.ES_MAX_RECONNECTIONS
+MOVIES_EXTRACTION = settings.ETL_MOVIES_EXTRACTION
+LOOKUP_CACHE_SIZE = settings.ETL_LOOKUP_CACHE_SIZE
+PARTITIONS = settings.ETL_PARTITIONS
+PRIORITY_SHARE = settings.ETL_PRIORITY_SHARE
+PRIORITY_WINDOW = timedelta(seconds=settings.ETL_PRIORITY_WINDOW)
+STATS_RETENTION = timedelta(days=settings.ETL_STATS_RETENTION)
+REPLICA_MAX_WAIT = settings.ETL_REPLICA_MAX_WAIT
+REBUILD_THRESHOLD = settings.ETL_REBUILD_THRESHOLD
+REBUILD_CHECK_INTERVAL = settings.ETL_REBUILD_CHECK_INTERVAL
+REBUILD_BATCH_SIZE = settings.ETL_REBUILD_BATCH_SIZE
+REBUILD_WATERMARK_MARGIN = timedelta(seconds=settings.ETL_REBUILD_WATERMARK_MARGIN)
 
 logger = logging.getLogger(__name__)
 
+# elasticsearch and pydantic are imported with the first batch that needs them,
+# so frequent runs with nothing to index start fast (see `run_etl.py`)
+
 
 def coroutine(func):
     @wraps(func)
@@ -39,28 +64,171 @@ class ETL:
     so there is no need in additional file- or Redis-based state storage
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, batch_size: int = ETL_BATCH_SIZE, movies_extraction: str = MOVIES_EXTRACTION,
+                 spool: Optional[Spool] = None, partitions: int = PARTITIONS,
+                 profiler: Optional[StageProfiler] = None, mode: str = 'incremental',
+                 rebuild_threshold: float = REBUILD_THRESHOLD, rebuild: bool = False):
+        self.batch_size = batch_size
+        # `incremental` or `rebuild`: picks the bulk rate caps, see `etl.throttle`
+        self.mode = mode
+        self.profiler = profiler
+        # concurrent ETL processes split the work by leasing primary key ranges, see `etl.leases`
+        self.partitions = partitions
+        # rows the next batch is taken from: a leased partition or the priority lane
+        self.scope = Q()
+        self.lanes = LaneScheduler(PRIORITY_SHARE, PRIORITY_WINDOW)
+        # index being extracted; a large backlog of it stops the incremental pass for a rebuild, see `etl.rebuild`
+        self.pipeline = None
+        self.backlog_monitor = BacklogMonitor(rebuild_threshold, REBUILD_CHECK_INTERVAL)
+        self.rebuild_due = rebuild
+        # set while a rebuild streams all rows in primary key order into `rebuild_indexes[pipeline]`
+        self.scan = False
+        self.rebuild_indexes = {}
+        # when set, documents are appended to the spool instead of being sent to ElasticSearch
+        self.spool = spool
+        # `aggregated`: one grouped query per batch builds all arrays;
+        # `normalized`: film rows, then m2m rows, then names from in-process lookups
+        self.movies_extraction = movies_extraction
+        self.person_names = NameLookup(Person, 'name', LOOKUP_CACHE_SIZE)
+        self.genre_names = NameLookup(m.Genre, 'genre', LOOKUP_CACHE_SIZE)
 
     def start(self):
         """Start ETL process using coroutines"""
         logger.info('Starting ETL process...')
-        load_coroutine = self.load()
-        transform_coroutine = self.transform(load_coroutine)
-        self.extract(transform_coroutine)
-
-        load_coroutine = self.load()
-        transform_coroutine = self.transform_persons(load_coroutine)
-        self.extract_persons(transform_coroutine)
-
-        load_coroutine = self.load()
-        transform_coroutine = self.transform_genres(load_coroutine)
-        self.extract_genres(transform_coroutine)
+        prune_batches(STATS_RETENTION)
+        load = self.spool_load if self.spool else self.load
+        pipelines = (('movies', self.extract, self.transform, self.get_updated_movies),
+                     ('persons', self.extract_persons, self.transform_persons, self.get_updated_perons),
+                     ('genres', self.extract_genres, self.transform_genres, self.get_updated_genres))
+        force_rebuild = self.rebuild_due
+        for pipeline, extract, transform, get_updated in pipelines:
+            self.recover_rebuild(pipeline)
+            self.rebuild_due = force_rebuild
+            if not self.rebuild_due:
+                self.extract_leased(pipeline, extract, transform(load()))
+            # the incremental pass stopped between batches, it resumes from the rebuild's watermark
+            while self.rebuild_due:
+                self.rebuild_due = False
+                self.rebuild(pipeline, transform, get_updated)
+                self.extract_leased(pipeline, extract, transform(load()))
+
+        if self.spool:
+            self.spool.seal()
+
+    def stage(self, name: str):
+        """Time a stage of the batch when profiling"""
+        return self.profiler.stage(name) if self.profiler else nullcontext()
+
+    @contextmanager
+    def extraction_reads(self):
+        """
+        Extract from the replica once it has replayed the primary's changes: rows read
+        from a lagging replica would be indexed stale and still marked as indexed on the primary
+        """
+        use_replica = has_replica() and wait_for_replica(REPLICA_MAX_WAIT)
+        if has_replica() and not use_replica:
+            logger.warning(f'Replica is behind for over {REPLICA_MAX_WAIT}s, extracting from the primary')
+        with replica_reads(use_replica):
+            yield
+
+    def extract_leased(self, pipeline: str, extract, target):
+        """Run `extract` over every partition not leased by another ETL process, until a rebuild is due"""
+        self.pipeline = pipeline
+        try:
+            with closing(PartitionLeases(pipeline, self.partitions).leased()) as partitions:
+                for self.scope in partitions:
+                    extract(target)
+                    if self.profiler:
+                        # the final poll that found nothing
+                        self.profiler.end_batch(pipeline, 0)
+                    if self.rebuild_due:
+                        break
+        finally:
+            self.scope = Q()
+            self.pipeline = None
+
+    def rebuild(self, pipeline: str, transform, get_updated):
+        """
+        Stream all rows of `pipeline` into a fresh index, swap the alias to it
+        and set the watermark the incremental ETL resumes from, see `etl.rebuild`.
+        Skipped while another ETL process rebuilds the same index
+        """
+        with PartitionLeases(pipeline, self.partitions).lease(REBUILD_LEASE) as acquired:
+            if not acquired:
+                logger.info(f'{pipeline} is rebuilt by another ETL process, going on incrementally')
+                return
+            from etl.es import get_es_client
+            es = get_es_client()
+            watermark = timezone.now() - REBUILD_WATERMARK_MARGIN
+            self.rebuild_indexes[pipeline] = index = create_index(es, pipeline)
+            logger.info(f'Rebuilding {pipeline} into {index}')
+            try:
+                self.scan_all(pipeline, get_updated, transform(self.load('rebuild')))
+                store_watermark(pipeline, watermark)
+                publish_index(es, pipeline, index)
+            except BaseException:
+                drop_index(es, index)
+                raise
+            finally:
+                del self.rebuild_indexes[pipeline]
+            apply_watermark(pipeline)
+            logger.info(f'{pipeline} rebuilt, changes since {watermark} are indexed incrementally')
+
+    def recover_rebuild(self, pipeline: str):
+        """Requeue changes a rebuild of `pipeline` may have lost if its process died around the alias swap"""
+        with PartitionLeases(pipeline, self.partitions).lease(REBUILD_LEASE) as acquired:
+            # a rebuild in progress holds the lease and applies its own watermark
+            if acquired:
+                apply_watermark(pipeline, published=False)
+
+    def scan_all(self, pipeline: str, get_updated, target):
+        """Send all rows to `target` in primary key order, `get_updated` reads batches after the last key"""
+        batch_size, self.batch_size = self.batch_size, REBUILD_BATCH_SIZE
+        self.scan = True
+        try:
+            last_id = None
+            while True:
+                self.scope = Q(pk__gt=last_id) if last_id else Q()
+                with self.stage('extract'), self.extraction_reads():
+                    rows = get_updated()
+                if not rows:
+                    return
+                with self.stage('transform'):
+                    target.send(rows)
+                last_id = rows[-1].id
+                if self.profiler:
+                    self.profiler.end_batch(pipeline, len(rows))
+        finally:
+            self.batch_size = batch_size
+            self.scan = False
+            self.scope = Q()
+
+    def next_batch(self, get_updated):
+        """
+        Batch from the priority lane on its turns, oldest changes otherwise.
+        The priority lane is not partitioned: fresh edits are not kept waiting
+        until a worker reaches their partition, a rare duplicate index request is harmless.
+        Empty when the backlog has grown large enough for a rebuild
+        """
+        if self.pipeline and self.backlog_monitor.due(self.pipeline):
+            self.rebuild_due = True
+            return []
+        with self.extraction_reads():
+            if self.lanes.priority_turn():
+                partition, self.scope = self.scope, self.lanes.priority_filter()
+                try:
+                    batch = get_updated()
+                finally:
+                    self.scope = partition
+                if batch:
+                    return batch
+            return get_updated()
 
     def extract(self, target):
         """Extract updated movies and related models"""
         while True:
-            film_works = self.get_updated_movies()
+            with self.stage('extract'):
+                film_works = self.next_batch(self.get_updated_movies)
 
             if not film_works:
                 logger.debug('Got no FilmWorks to update')
@@ -68,22 +236,30 @@ class ETL:
             else:
                 count = len(film_works)
                 logger.debug(f'Extracted {count} FilmWorks')
-            target.send(film_works)
+            # load runs inside the transform coroutine, its own stages are timed apart
+            with self.stage('transform'):
+                target.send(film_works)
 
             # ensure we update indexed_at field
-            indexed_at = datetime.now()
-            for film in film_works:
-                film.indexed_at = indexed_at
             # note that this will not apply to `modified` field
-            # because of the default bulk_update implementation - and this is what we want
-            FilmWork.objects.bulk_update(film_works, ['indexed_at'])
+            # because `update` skips `pre_save` - and this is what we want
+            with self.stage('mark'):
+                FilmWork.objects.filter(id__in=[film.id for film in film_works]).update(indexed_at=datetime.now())
+            if self.profiler:
+                self.profiler.end_batch('movies', len(film_works))
 
     @coroutine
     def transform(self, target):
         """Transform list of FilmWorks into the ElasticSearch format"""
+        FilmWorkES = None
         while True:
             film_works = (yield)
-            count = len(film_works)
+            if FilmWorkES is None:
+                # imported with the first batch, a run with nothing to index never loads pydantic
+                from etl.bulk import document_version
+                from etl.documents import FilmWorkES
+                from pydantic import ValidationError
+            last_modified = [film.last_modified for film in film_works]
             docs = []
             for film in film_works:
                 actors = [{'id': str(uuid), 'full_name': name}
@@ -106,32 +282,62 @@ class ETL:
                                      actors=actors,
                                      writers=writers,
                                      directors=directors,
-                                     description=film.description)
+                                     description=film.description,
+                                     title_suggest=self._title_suggest(film),
+                                     content_hash=movie_hash(film))
                 except ValidationError as e:
                     logger.error(e)
                     raise e
                 doc = doc.dict()
                 doc['_index'] = 'movies'
                 doc['_id'] = str(film.id)
+                doc.update(document_version(film.last_modified))
                 docs.append(doc)
-            target.send((docs, count))
+            target.send((docs, last_modified))
+
+    @coroutine
+    def load(self, mode: Optional[str] = None):
+        """Load data to ElasticSearch index, with the bulk rate caps of `mode` or of the ETL"""
+        bulk = None
+        while True:
+            docs, last_modified = (yield)
+            if not docs:
+                continue
+            if bulk is None:
+                from etl.bulk import BulkLoader
+                from etl.es import get_es_client
+                bulk = BulkLoader(get_es_client(), mode or self.mode)
+                logger.debug('Connected to ElasticSearch')
+            index = docs[0]['_index']
+            if index in self.rebuild_indexes:
+                # the alias still points to the live index until the rebuild is complete
+                for doc in docs:
+                    doc['_index'] = self.rebuild_indexes[index]
+            started = time.perf_counter()
+            with self.stage('bulk'):
+                stats = bulk(docs)
+            if index not in self.rebuild_indexes:
+                # rebuilt documents are not changes, their lag would only skew the statistics
+                record_batch(index, last_modified, time.perf_counter() - started,
+                             stats.raw_bytes, stats.compressed_bytes)
+            logger.debug(f'Indexed {len(docs)} docs')
 
     @coroutine
-    def load(self):
-        """Load data to ElasticSearch index"""
-        config = {'host': settings.ES_HOST,
-                  'port': settings.ES_PORT,
-                  }
-        es = Elasticsearch([config, ])
-        logger.debug('Connected to ElasticSearch')
+    def spool_load(self):
+        """
+        Durably append docs to the spool, `drain_spool` loads them later
+        and records their batch statistics once ElasticSearch acknowledges them
+        """
         while True:
-            docs, count = (yield)
-            self._bulk(es, docs)
-            logger.debug(f'Indexed {count} docs')
+            docs, _ = (yield)
+            with self.stage('spool'):
+                self.spool.append(docs)
+            logger.debug(f'Spooled {len(docs)} docs')
 
     def extract_persons(self, target):
         while True:
-            persons = self.get_updated_perons()
+            with self.stage('extract'):
+                persons = self.next_batch(self.get_updated_perons)
 
             if not persons:
                 logger.debug('Got no Persons to update')
@@ -139,89 +345,176 @@ class ETL:
             else:
                 count = len(persons)
                 logger.debug(f'Extracted {count} Persons')
-            target.send(persons)
+            with self.stage('transform'):
+                target.send(persons)
 
             # ensure we update indexed_at field
-            indexed_at = datetime.now()
-            for person in persons:
-                person.indexed_at = indexed_at
             # note that this will not apply to `modified` field
-            # because of the default bulk_update implementation - and this is what we want
-            Person.objects.bulk_update(persons, ['indexed_at'])
+            # because `update` skips `pre_save` - and this is what we want
+            with self.stage('mark'):
+                Person.objects.filter(id__in=[person.id for person in persons]).update(indexed_at=datetime.now())
+            if self.profiler:
+                self.profiler.end_batch('persons', len(persons))
 
     @coroutine
     def transform_persons(self, target):
+        PersonES = None
         while True:
             persons = (yield)
-            count = len(persons)
+            if PersonES is None:
+                from etl.bulk import document_version
+                from etl.documents import Person as PersonES
+                from pydantic import ValidationError
+            last_modified = [person.last_modified for person in persons]
             docs = []
             for person in persons:
                 try:
-                    doc = BasePerson(id=str(person.id),
-                                     full_name=person.name)
+                    doc = PersonES(id=str(person.id),
+                                   full_name=person.name,
+                                   films=person.films,
+                                   name_suggest=self._name_suggest(person),
+                                   content_hash=person_hash(person))
                 except ValidationError as e:
                     logger.error(e)
                     raise e
                 doc = doc.dict()
                 doc['_index'] = 'persons'
                 doc['_id'] = str(person.id)
+                doc.update(document_version(person.last_modified))
                 docs.append(doc)
-            target.send((docs, count))
+            target.send((docs, last_modified))
 
     def extract_genres(self, target):
         while True:
-            genres = self.get_updated_genres()
+            with self.stage('extract'):
+                genres = self.next_batch(self.get_updated_genres)
 
             if not genres:
                 return
-            target.send(genres)
+            with self.stage('transform'):
+                target.send(genres)
 
             # ensure we update indexed_at field
-            indexed_at = datetime.now()
-            for genre in genres:
-                genre.indexed_at = indexed_at
             # note that this will not apply to `modified` field
-            # because of the default bulk_update implementation - and this is what we want
-            m.Genre.objects.bulk_update(genres, ['indexed_at'])
+            # because `update` skips `pre_save` - and this is what we want
+            with self.stage('mark'):
+                m.Genre.objects.filter(id__in=[genre.id for genre in genres]).update(indexed_at=datetime.now())
+            if self.profiler:
+                self.profiler.end_batch('genres', len(genres))
 
     @coroutine
     def transform_genres(self, target):
+        Genre = None
         while True:
             genres = (yield)
-            count = len(genres)
+            if Genre is None:
+                from etl.bulk import document_version
+                from etl.documents import Genre
+                from pydantic import ValidationError
+            last_modified = [genre.last_modified for genre in genres]
             docs = []
             for genre in genres:
                 try:
                     doc = Genre(id=str(genre.id),
                                 name=genre.genre,
-                                description='')
+                                description=genre.description,
+                                film_count=genre.film_count,
+                                avg_imdb_rating=genre.avg_imdb_rating,
+                                top_film_ids=[str(uuid) for uuid in genre.top_film_ids],
+                                content_hash=genre_hash(genre))
                 except ValidationError as e:
                     logger.error(e)
                     raise e
                 doc = doc.dict()
                 doc['_index'] = 'genres'
                 doc['_id'] = str(genre.id)
+                doc.update(document_version(genre.last_modified))
                 docs.append(doc)
-            target.send((docs, count))
+            target.send((docs, last_modified))
+
+    @staticmethod
+    def _title_suggest(film) -> dict:
+        """Autocomplete entry for a film title (`Suggest`); better rated films are suggested first"""
+        weight = round((film.imdb_rating or 0) * 10)
+        return {'input': [film.title], 'weight': weight}
 
     @staticmethod
-    @backoff.on_exception(backoff.expo, ConnectionError, max_tries=ES_MAX_RECONNECTIONS)
-    def _bulk(es, docs):
-        """Bulk wrapped with backoff"""
-        bulk(es, docs)
+    def _name_suggest(person) -> dict:
+        """
+        Autocomplete entry for a person (`Suggest`), matched from the first name as well as from the surname;
+        persons with more films are suggested first
+        """
+        words = person.name.split()
+        return {'input': [person.name] + words[1:], 'weight': len(person.films)}
 
-    def get_updated_movies(self) -> List[FilmWork]:  # not just FilmWork, but FilmWork with extra annotated fields
+    def get_updated_movies(self) -> List[MovieRow]:
         """
-        Get queryset with recently modified movies,
+        Get batch of recently modified movies,
         movies with recently modified related entities or relations.
         """
-        # annotate latest update of filmwork itself or related models
+        if self.movies_extraction == 'normalized':
+            return self.get_updated_movies_normalized()
+        qs = self.updated_movies_queryset().values_list(*MovieRow._fields)
+        return [MovieRow._make(row) for row in qs[0:self.batch_size]]
+
+    def get_updated_movies_normalized(self) -> List[MovieRow]:
+        """
+        Same batch as `get_updated_movies`, extracted in steps that never join persons with genres:
+        film rows, their m2m rows with `IN` lookups, and names from the lookup caches
+        """
+        # the latest relation or related entity change is a MAX subquery per film
         last_db_update = Greatest('modified',
-                                  'persons__modified',
-                                  'genres__modified',
-                                  'filmworkperson__modified',
-                                  'filmworkgenre__modified')
-        qs = FilmWork.objects.annotate(last_modified=last_db_update)
+                                  self._last_relation_update(FilmWorkPerson, 'film_work', 'person__modified'),
+                                  self._last_relation_update(FilmWorkGenre, 'film_work', 'genre__modified'))
+        qs = FilmWork.objects.filter(self.scope).annotate(last_modified=last_db_update)
+        qs = self.pending(qs)
+        qs = qs.values_list('id', 'title', 'description', 'imdb_rating', 'last_modified')
+        films = list(qs[0:self.batch_size])
+        if not films:
+            return []
+        film_ids = [film[0] for film in films]
+
+        film_persons = defaultdict(set)
+        fwp = FilmWorkPerson.objects.filter(film_work_id__in=film_ids)
+        for film_id, person_id, job in fwp.values_list('film_work_id', 'person_id', 'job'):
+            film_persons[film_id].add((job, person_id))
+        film_genres = defaultdict(set)
+        fwg = FilmWorkGenre.objects.filter(film_work_id__in=film_ids)
+        for film_id, genre_id in fwg.values_list('film_work_id', 'genre_id'):
+            film_genres[film_id].add(genre_id)
+
+        self.person_names.refresh()
+        self.genre_names.refresh()
+        person_names = self.person_names.get_many(pk for pairs in film_persons.values() for _, pk in pairs)
+        genre_names = self.genre_names.get_many(pk for pks in film_genres.values() for pk in pks)
+
+        rows = []
+        for film in films:
+            # names are sorted as in the aggregated query, ids stay paired with their names here;
+            # the aggregated query sorts its id and name arrays independently, so only the names match.
+            # An entity deleted since the m2m rows were read is left out, as the join of the aggregated query does
+            genres = sorted(((genre_names[pk], pk) for pk in film_genres[film[0]] if pk in genre_names),
+                            key=lambda pair: pair[0])
+            relations = {'genres_ids': [pk for _, pk in genres],
+                         'genres_list': [name for name, _ in genres]}
+            for job in PersonJob.values:
+                persons = sorted(((person_names[pk], pk) for person_job, pk in film_persons[film[0]]
+                                  if person_job == job and pk in person_names), key=lambda pair: pair[0])
+                relations[job + '_ids'] = [pk for _, pk in persons]
+                relations[job + '_names'] = [name for name, _ in persons]
+            rows.append(MovieRow(*film, **relations))
+        return rows
+
+    def updated_movies_queryset(self) -> QuerySet:
+        """All movies to reindex as FilmWorks with extra annotated fields, old changes come first"""
+        # annotate latest update of filmwork itself or related models;
+        # MAX folds the joined rows, so every film is one group
+        last_db_update = Max(Greatest('modified',
+                                      'persons__modified',
+                                      'genres__modified',
+                                      'filmworkperson__modified',
+                                      'filmworkgenre__modified'))
+        qs = FilmWork.objects.filter(self.scope).annotate(last_modified=last_db_update)
 
         # annotate related models using aggregation for easier transform
         qs = qs.annotate(genres_list=ArrayAgg('genres__genre',
@@ -241,51 +534,109 @@ class ETL:
                                          filter=Q(filmworkperson__job=job))}
             qs = qs.annotate(**kwarg)
 
-        # defer unneeded fields
-        qs = qs.defer('persons',
-                      'genres',
-                      'creation_date',
-                      'film_rating',
-                      'film_type',
-                      'created',
-                      'modified')
         # filter by latest update, order by latest update (old comes first)
-        qs = qs.filter(last_modified__gt=F('indexed_at'))
-        qs = qs.order_by('last_modified')
-
-        qs = qs[0:ETL_BATCH_SIZE]
-        return list(qs)
+        qs = self.pending(qs)
+        return qs
 
-    def get_updated_perons(self) -> List[Person]:  # not just FilmWork, but FilmWork with extra annotated fields
+    def get_updated_perons(self) -> List[PersonRow]:
         """
-        Get queryset with recently modified movies,
-        movies with recently modified related entities or relations.
+        Get batch of recently modified persons,
+        persons with recently modified films or relations.
         """
-        # annotate latest update of filmwork itself or related models
+        qs = self.updated_persons_queryset().values_list('id', 'name', 'last_modified')
+        persons = list(qs[0:self.batch_size])
+
+        films = self.get_person_films(person[0] for person in persons)
+        return [PersonRow(*person, films=films[person[0]]) for person in persons]
+
+    def updated_persons_queryset(self) -> QuerySet:
+        """All persons to reindex, old changes come first"""
+        # annotate latest update of person itself or related models;
+        # relations are folded into one MAX per person, so each person comes once
+        # however many films they have
         last_db_update = Greatest('modified',
-                                  'filmwork__modified',
-                                  'filmworkperson__modified', )
-        qs = Person.objects.annotate(last_modified=last_db_update)
+                                  self._last_relation_update(FilmWorkPerson, 'person', 'film_work__modified'))
+        qs = Person.objects.filter(self.scope).annotate(last_modified=last_db_update)
 
-        qs = qs.filter(last_modified__gt=F('indexed_at'))
-        qs = qs.order_by('last_modified')
+        qs = self.pending(qs)
+        return qs
 
-        qs = qs[0:ETL_BATCH_SIZE]
-        return list(qs)
+    def pending(self, qs: QuerySet) -> QuerySet:
+        """
+        Rows changed since they were indexed, old changes come first;
+        during a rebuild scan all rows in primary key order
+        """
+        if self.scan:
+            return qs.order_by('pk')
+        qs = qs.filter(last_modified__gt=F('indexed_at'))
+        return qs.order_by('last_modified')
 
-    def get_updated_genres(self) -> List[Genre]:
+    @staticmethod
+    def get_person_films(person_ids: Iterable[UUID]) -> Dict[UUID, List['PersonFilm']]:
+        """
+        Films of every person with the person's roles in them,
+        fetched with one grouped query for the whole batch
+        """
+        person_ids = list(person_ids)
+        if not person_ids:
+            return {}
+        from etl.documents import PersonFilm
+
+        qs = FilmWorkPerson.objects.filter(person_id__in=person_ids)
+        qs = qs.values('person_id', 'film_work_id', 'film_work__title')
+        qs = qs.annotate(roles=ArrayAgg('job', distinct=True))
+        qs = qs.order_by('person_id', 'film_work__title')
+
+        films = defaultdict(list)
+        for row in qs:
+            films[row['person_id']].append(PersonFilm(id=str(row['film_work_id']),
+                                                      title=row['film_work__title'],
+                                                      roles=row['roles']))
+        return films
+
+    def get_updated_genres(self) -> List[GenreRow]:
         """
         Get list with recently modified genres
         :return:
         """
-        # annotate latest update of filmwork itself or related models
+        qs = self.updated_genres_queryset().values_list('id', 'genre', 'description', 'last_modified')
+        genres = list(qs[0:self.batch_size])
+
+        stats = self.get_genre_stats(genre[0] for genre in genres)
+        empty_stats = {'film_count': 0, 'avg_imdb_rating': None, 'top_film_ids': []}
+        return [GenreRow(*genre, **stats.get(genre[0], empty_stats)) for genre in genres]
+
+    def updated_genres_queryset(self) -> QuerySet:
+        """All genres to reindex, old changes come first"""
+        # annotate latest update of genre itself or related models, one row per genre;
+        # from films only rating changes matter: that is all the genre statistics depend on;
+        # deleted relations and films touch the genre itself (see migration `movies.0015_reindex_triggers`)
         last_db_update = Greatest('modified',
-                                  'filmwork__modified',
-                                  'filmworkgenre__modified', )
-        qs = m.Genre.objects.annotate(last_modified=last_db_update)
+                                  self._last_relation_update(FilmWorkGenre, 'genre', 'film_work__rating_modified'))
+        qs = m.Genre.objects.filter(self.scope).annotate(last_modified=last_db_update)
 
-        qs = qs.filter(last_modified__gt=F('indexed_at'))
-        qs = qs.order_by('last_modified')
+        qs = self.pending(qs)
+        return qs
 
-        qs = qs[0:ETL_BATCH_SIZE]
-        return list(qs)
+    @staticmethod
+    def get_genre_stats(genre_ids: Iterable[UUID]) -> Dict[UUID, dict]:
+        """
+        Film count, average IMDb rating and best rated films of every genre,
+        computed with one grouped query for the whole batch
+        """
+        qs = FilmWorkGenre.objects.filter(genre_id__in=list(genre_ids))
+        qs = qs.values('genre_id').annotate(**genre_stats())
+        qs = qs.order_by()
+        return {row.pop('genre_id'): row for row in qs}
+
+    @staticmethod
+    def _last_relation_update(through: Model, entity: str, related_field: str) -> Subquery:
+        """
+        Latest `modified` of the outer `entity`'s m2m rows in `through`
+        and latest `related_field` of the entities they link to; NULL (ignored by GREATEST) if there are none
+        """
+        qs = through.objects.filter(**{entity: OuterRef('pk')})
+        qs = qs.order_by().values(entity)
+        last_modified = Greatest('modified', related_field, output_field=DateTimeField())
+        qs = qs.annotate(last_modified=Max(last_modified))
+        return Subquery(qs.values('last_modified'))
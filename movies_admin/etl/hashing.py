@@ -0,0 +1,108 @@
+"""
+Content hashes of indexed documents, computed both by the ETL (stored in the `content_hash` field)
+and by Postgres for `reconcile_es`, which compares them without transforming anything.
+
+The hash covers the entity's own indexed fields and the ids of its relations, and for genres
+the statistics of their films, joined with a unit separator; relation signatures are sorted
+in byte order on both sides.
+Names of related entities are left out: their renames are followed by the ETL itself.
+Both halves of every pair below must be kept in sync.
+"""
+
+import hashlib
+import math
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg, StringAgg
+from django.db.models import Avg, BigIntegerField, Count, F, FloatField, Func, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import MD5, Cast, Coalesce, Collate, Concat, Floor
+
+from etl.rows import GenreRow, MovieRow, PersonRow
+from movies.expressions import ArraySlice
+from movies.models import FilmWorkGenre, FilmWorkPerson, PersonJob
+
+SEPARATOR = '\x1f'
+GENRE_TOP_FILMS = settings.ETL_GENRE_TOP_FILMS
+
+
+def genre_stats() -> dict:
+    """
+    Aggregates of a genre's films over its `FilmWorkGenre` rows: the indexed statistics,
+    shared by the ETL extraction and `genre_hash_sql`
+    """
+    # ties are broken by id: a title change does not reindex genres, it must not reorder them either
+    best_first = (F('film_work__imdb_rating').desc(nulls_last=True), 'film_work')
+    return {'film_count': Count('film_work', distinct=True),
+            'avg_imdb_rating': Avg('film_work__imdb_rating'),
+            'top_film_ids': ArraySlice(ArrayAgg('film_work', ordering=best_first), GENRE_TOP_FILMS)}
+
+
+def _hash(*parts: str) -> str:
+    return hashlib.md5(SEPARATOR.join(parts).encode()).hexdigest()
+
+
+def _signature(items: Iterable[str]) -> str:
+    return ','.join(sorted(set(items)))
+
+
+def _rating(rating: Optional[float]) -> str:
+    # compared as whole hundredths: float to text conversions of Python and Postgres differ
+    return '' if rating is None else str(math.floor(rating * 100))
+
+
+def movie_hash(film: MovieRow) -> str:
+    # aggregated extraction gives [None] for a film without relations of a kind
+    persons = [f'{job}:{pk}' for job in PersonJob.values for pk in getattr(film, job + '_ids') if pk]
+    return _hash(film.title, film.description or '', _rating(film.imdb_rating),
+                 _signature(str(pk) for pk in film.genres_ids if pk), _signature(persons))
+
+
+def person_hash(person: PersonRow) -> str:
+    return _hash(person.name, _signature(f'{film.id}:{role}' for film in person.films for role in film.roles))
+
+
+def genre_hash(genre: GenreRow) -> str:
+    # top films keep their order: it is the ranking the document shows
+    return _hash(genre.genre, genre.description or '', str(genre.film_count), _rating(genre.avg_imdb_rating),
+                 ','.join(str(pk) for pk in genre.top_film_ids))
+
+
+def _relation_signature(through, entity: str, *parts) -> Coalesce:
+    """Sorted distinct `parts` of the outer entity's m2m rows joined by commas, as `_signature` does"""
+    signature = Collate(Concat(*parts, output_field=TextField()) if len(parts) > 1 else parts[0], 'C')
+    qs = through.objects.filter(**{entity: OuterRef('pk')}).order_by().values(entity)
+    qs = qs.annotate(signature=StringAgg(signature, ',', distinct=True, ordering=signature,
+                                                  output_field=TextField()))
+    return Coalesce(Subquery(qs.values('signature'), output_field=TextField()), Value(''))
+
+
+def _sql_hash(*parts) -> MD5:
+    separated = []
+    for part in parts:
+        separated += [part, Value(SEPARATOR)]
+    return MD5(Concat(*separated[:-1], output_field=TextField()))
+
+
+def movie_hash_sql() -> MD5:
+    rating = Cast(Floor(F('imdb_rating') * 100), BigIntegerField())
+    return _sql_hash('title', 'description', Cast(rating, TextField()),
+                     _relation_signature(FilmWorkGenre, 'film_work', Cast('genre_id', TextField())),
+                     _relation_signature(FilmWorkPerson, 'film_work', 'job', Value(':'),
+                                         Cast('person_id', TextField())))
+
+
+def person_hash_sql() -> MD5:
+    return _sql_hash('name', _relation_signature(FilmWorkPerson, 'person', Cast('film_work_id', TextField()),
+                                                 Value(':'), 'job'))
+
+
+def genre_hash_sql() -> MD5:
+    stats = FilmWorkGenre.objects.filter(genre=OuterRef('pk')).order_by().values('genre').annotate(**genre_stats())
+    film_count = Coalesce(Subquery(stats.values('film_count'), output_field=BigIntegerField()), Value(0))
+    rating = Subquery(stats.values('avg_imdb_rating'), output_field=FloatField())
+    rating = Cast(Floor(rating * 100), BigIntegerField())
+    top_films = stats.annotate(top_films=Func('top_film_ids', Value(','), function='ARRAY_TO_STRING',
+                                              output_field=TextField()))
+    top_films = Coalesce(Subquery(top_films.values('top_films'), output_field=TextField()), Value(''))
+    return _sql_hash('genre', 'description', Cast(film_count, TextField()), Cast(rating, TextField()), top_films)
@@ -0,0 +1,65 @@
+"""
+Work partitioning between concurrent ETL processes.
+
+The uuid space of every indexed model is split into `ETL_PARTITIONS` equal ranges
+(random uuids spread evenly, and a range filter on the primary key is an index scan).
+A worker processes a range only while it holds a session-level Postgres advisory lock on it,
+so several `start_etl` containers extract disjoint batches instead of the same oldest rows.
+
+The lock is the lease: it is released explicitly after the range is caught up,
+and by Postgres when the worker's connection ends, so the range of a crashed
+or killed worker is picked up by the next worker that tries it.
+"""
+
+import os
+import zlib
+from contextlib import contextmanager
+from typing import Iterator
+from uuid import UUID
+
+from django.db import connection
+from django.db.models import Q
+
+UUID_SPACE = 2 ** 128
+
+
+class PartitionLeases:
+    """Advisory-lock leases on uuid ranges of one ETL pipeline"""
+
+    def __init__(self, pipeline: str, partitions: int):
+        self.pipeline = pipeline
+        self.partitions = partitions
+        # first key of the two-int advisory lock, keeps pipelines and other lock users apart
+        self.lock_class = zlib.crc32(f'etl:{pipeline}'.encode()) & 0x7fffffff
+
+    def partition_filter(self, partition: int) -> Q:
+        """Primary key range of `partition`"""
+        lower = UUID(int=UUID_SPACE * partition // self.partitions)
+        if partition == self.partitions - 1:
+            return Q(pk__gte=lower)
+        upper = UUID(int=UUID_SPACE * (partition + 1) // self.partitions)
+        return Q(pk__gte=lower, pk__lt=upper)
+
+    def leased(self) -> Iterator[Q]:
+        """
+        Lease every free partition in turn and yield its filter; partitions leased by other
+        workers are skipped. Workers start at different partitions so they rarely collide.
+        """
+        start = os.getpid() % self.partitions
+        for i in range(self.partitions):
+            partition = (start + i) % self.partitions
+            with self.lease(partition) as acquired:
+                if acquired:
+                    yield self.partition_filter(partition)
+
+    @contextmanager
+    def lease(self, partition: int):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', [self.lock_class, partition])
+            acquired = cursor.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [self.lock_class, partition])
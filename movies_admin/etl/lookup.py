@@ -0,0 +1,65 @@
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Iterable
+from uuid import UUID
+
+from django.db.models import Max, Model
+from django.utils import timezone
+
+from movies.models import DATETIME_ANCIENT
+
+
+class NameLookup:
+    """
+    In-process LRU cache of `id -> name` for persons or genres.
+
+    Before every batch `refresh` re-reads the rows modified since the last refresh
+    (the `modified` index makes it a short range scan), so renamed entities never
+    stay stale; ids missing in the cache are read with one `IN` query per batch.
+    Popular persons and genres are thus read from Postgres once per run instead of once per film.
+    """
+
+    # rows may be committed a while after their `modified` was set, re-read a margin behind the watermark
+    REFRESH_MARGIN = timedelta(minutes=1)
+
+    def __init__(self, model: Model, name_field: str, maxsize: int):
+        self.model = model
+        self.name_field = name_field
+        self.maxsize = maxsize
+        self._names = OrderedDict()
+        self._watermark = None
+        self.hits = 0
+        self.misses = 0
+
+    def refresh(self):
+        """Update cached names of the entities modified since the previous refresh"""
+        if self._watermark is None:
+            # nothing is cached yet; remember where the changes have to be followed from
+            last = self.model.objects.aggregate(last=Max('modified'))['last']
+            self._watermark = last or timezone.make_aware(DATETIME_ANCIENT)
+            return
+        qs = self.model.objects.filter(modified__gte=self._watermark - self.REFRESH_MARGIN)
+        for pk, name, modified in qs.values_list('pk', self.name_field, 'modified'):
+            if pk in self._names:
+                self._names[pk] = name
+            self._watermark = max(self._watermark, modified)
+
+    def get_many(self, ids: Iterable[UUID]) -> Dict[UUID, str]:
+        """Names of all `ids`, missing ones are fetched at once"""
+        ids = set(ids)
+        names = {}
+        for pk in ids:
+            if pk in self._names:
+                self._names.move_to_end(pk)
+                names[pk] = self._names[pk]
+        missing = ids - names.keys()
+        self.hits += len(names)
+        self.misses += len(missing)
+        if missing:
+            qs = self.model.objects.filter(pk__in=missing).values_list('pk', self.name_field)
+            for pk, name in qs:
+                names[pk] = name
+                self._names[pk] = name
+            while len(self._names) > self.maxsize:
+                self._names.popitem(last=False)
+        return names
@@ -0,0 +1,101 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from etl.bulk import BulkLoader
+from etl.es import get_es_client
+from etl.etl import ETL
+from etl.models import IndexBatch
+from etl.reconcile import Reconciler
+from etl.stats import INDEX_MODELS
+from movies.benchmarks import delete_catalog, seed_catalog
+from movies.management.commands.generate_changes import add_workload_arguments, workload_from_options
+from movies.models import FilmWork, Genre, Person
+
+
+class Command(BaseCommand):
+    """
+    Measure how the incremental ETL copes with a change workload (see `movies.workload`):
+    a tagged catalog is seeded and the ETL catches up, then the changes are made to the seeded
+    catalog only, then the time of the ETL run that indexes them is taken, with documents
+    re-extracted and bulk bytes per change from the recorded batch statistics.
+    The seeded rows and their documents are deleted afterwards; the real catalog is only indexed
+    """
+    help = 'Benchmark incremental ETL catch-up after a change workload'
+
+    def add_arguments(self, parser):
+        add_workload_arguments(parser)
+        parser.add_argument('--films', type=int, default=10_000,
+                            help='Films of the seeded catalog the changes are made to')
+        parser.add_argument('--persons-per-film', type=int, default=20)
+        parser.add_argument('--genres-per-film', type=int, default=3)
+        parser.add_argument('--reconcile', action='store_true',
+                            help='Count the documents left stale after the catch-up, e.g. of deleted films')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        self.deleted_films = []
+        try:
+            self.measure(tag, options)
+        finally:
+            self.remove_catalog(tag)
+
+    def measure(self, tag: str, options: dict):
+        self.stdout.write(f'Seeding catalog {tag} of {options["films"]} films...')
+        with transaction.atomic():
+            seed_catalog(options['films'], options['persons_per_film'], options['genres_per_film'], tag=tag)
+        # automatic rebuilds would replace what is measured
+        self.stdout.write('Catching up before the workload...')
+        ETL(rebuild_threshold=0).start()
+
+        workload = workload_from_options(options, tag)
+        self.deleted_films = workload.deleted
+        started = timezone.now()
+        generating = time.perf_counter()
+        made = workload.run(options['changes'], options['rate'])
+        generating = time.perf_counter() - generating
+        changes = sum(count for change, count in made.items() if change != 'skipped') or 1
+        self.stdout.write(f'{changes} changes in {generating:.1f}s: '
+                          + ', '.join(f'{change} {count}' for change, count in sorted(made.items())))
+
+        catching_up = time.perf_counter()
+        ETL(rebuild_threshold=0).start()
+        catching_up = time.perf_counter() - catching_up
+        self.stdout.write(f'catch-up {catching_up:.2f}s, {catching_up / changes * 1000:.2f}ms per change')
+
+        self.stdout.write(f'{"index":<8} {"docs":>8} {"docs/chg":>9} {"raw B/chg":>10} {"gzip B/chg":>11}')
+        totals = {'docs': 0, 'raw_bytes': 0, 'compressed_bytes': 0}
+        for index in INDEX_MODELS:
+            batches = IndexBatch.objects.filter(index=index, acked_at__gte=started)
+            stats = {key: value or 0 for key, value in batches.aggregate(
+                docs=Sum('docs'), raw_bytes=Sum('raw_bytes'), compressed_bytes=Sum('compressed_bytes')).items()}
+            self._row(index, stats, changes)
+            totals = {key: totals[key] + stats[key] for key in totals}
+        self._row('total', totals, changes)
+
+        if options['reconcile']:
+            es = get_es_client()
+            for index in INDEX_MODELS:
+                stats = Reconciler(es, index, dry_run=True).run()
+                self.stdout.write(f'{index}: {stats.missing} missing, {stats.mismatched} stale, '
+                                  f'{stats.orphans} orphaned documents')
+
+    def remove_catalog(self, tag: str):
+        """Delete the seeded rows and their documents, including those of films deleted by the workload"""
+        ids = {'movies': FilmWork.objects.filter(title__startswith=f'Film {tag} '),
+               'persons': Person.objects.filter(name__startswith=f'Person {tag} '),
+               'genres': Genre.objects.filter(genre__startswith=f'genre-{tag}-')}
+        actions = [{'_op_type': 'delete', '_index': index, '_id': str(pk)}
+                   for index, qs in ids.items() for pk in qs.values_list('id', flat=True).iterator()]
+        actions += [{'_op_type': 'delete', '_index': 'movies', '_id': str(pk)} for pk in self.deleted_films]
+        delete_catalog(tag)
+        BulkLoader(get_es_client())(actions)
+        self.stdout.write(f'Catalog {tag} deleted')
+
+    def _row(self, index: str, stats: dict, changes: int):
+        self.stdout.write(f'{index:<8} {stats["docs"]:>8} {stats["docs"] / changes:>9.2f} '
+                          f'{stats["raw_bytes"] / changes:>10.0f} {stats["compressed_bytes"] / changes:>11.0f}')
@@ -0,0 +1,48 @@
+import gc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from etl.etl import ETL
+from movies.benchmarks import median, peak_memory, seed_catalog, time_call
+
+
+class Command(BaseCommand):
+    """
+    Compare memory and time of materialising one batch of movies for the transform:
+    annotated FilmWork instances (the former extraction) against compact `MovieRow` tuples
+    of the aggregated and the normalized extraction.
+    Data is seeded inside a transaction that is rolled back afterwards.
+    """
+    help = 'Benchmark per-batch memory of ETL movie extraction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-sizes', default='1000,10000',
+                            help='comma-separated batch sizes')
+        parser.add_argument('--persons-per-film', type=int, default=20)
+        parser.add_argument('--genres-per-film', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        batch_sizes = [int(value) for value in options['batch_sizes'].split(',')]
+        self.stdout.write(f'{"batch":>7} {"rows as":>10} {"peak, KiB":>11} {"B/film":>8} {"time, ms":>10}')
+        with transaction.atomic():
+            seed_catalog(max(batch_sizes), options['persons_per_film'], options['genres_per_film'])
+            for batch_size in batch_sizes:
+                etl = ETL(batch_size=batch_size)
+                variants = {
+                    # the fields the former extraction deferred
+                    'models': lambda: list(etl.updated_movies_queryset().defer(
+                        'persons', 'genres', 'creation_date', 'film_rating',
+                        'film_type', 'created', 'modified')[0:batch_size]),
+                    'tuples': etl.get_updated_movies,
+                    'normalized': ETL(batch_size=batch_size, movies_extraction='normalized').get_updated_movies,
+                }
+                for name, extract in variants.items():
+                    gc.collect()
+                    peak, batch = peak_memory(extract)
+                    del batch
+                    timings = time_call(extract, options['repeat'])
+                    self.stdout.write(f'{batch_size:>7} {name:>10} {peak / 1024:>11.0f} '
+                                      f'{peak / batch_size:>8.0f} {median(timings):>10.1f}')
+            transaction.set_rollback(True)
@@ -0,0 +1,85 @@
+import time
+from collections import defaultdict
+from typing import List, Tuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch import ConnectionError
+from elasticsearch.helpers import BulkIndexError
+
+from etl.bulk import BulkLoader, BulkStats, version_time
+from etl.es import get_es_client
+from etl.spool import Spool, SpoolBusy
+from etl.stats import record_batch
+
+
+def record_chunk(actions: List[dict], bulk_seconds: float, stats: BulkStats):
+    """
+    Record loaded spool actions as one batch per index, with lags from their versions;
+    request sizes are shared between the indexes by document count
+    """
+    last_modified = defaultdict(list)
+    for action in actions:
+        # actions spooled before documents were versioned have no time to measure the lag from
+        if '_version' in action:
+            last_modified[action['_index']].append(version_time(action['_version']))
+    for index, times in last_modified.items():
+        share = len(times) / len(actions)
+        record_batch(index, times, bulk_seconds * share,
+                     round(stats.raw_bytes * share), round(stats.compressed_bytes * share))
+
+
+class Command(BaseCommand):
+    """
+    Load documents spooled by `start_etl --spool` to ElasticSearch.
+    Resumes from the last checkpoint after a crash or an ElasticSearch outage;
+    documents ElasticSearch rejects for good are set aside in the spool's dead letter file
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--follow', action='store_true',
+                            help='Keep draining new segments until interrupted')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between spool checks with --follow')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Documents per bulk request')
+        parser.add_argument('--mode', choices=settings.ETL_BULK_LIMITS, default='incremental',
+                            help='Bulk rate caps to load with')
+
+    def handle(self, *args, **options):
+        spool = self.spool = Spool(settings.ETL_SPOOL_DIR, settings.ETL_SPOOL_SEGMENT_SIZE)
+        self.bulk = BulkLoader(get_es_client(), options['mode'], dead_letter=self.dead_letter)
+        self.failed = set()
+
+        while True:
+            try:
+                loaded = spool.drain(self.load, options['chunk_size'])
+            except SpoolBusy:
+                if not options['follow']:
+                    raise CommandError(f'Spool {spool.directory} is drained by another process')
+            except ConnectionError as e:
+                if not options['follow']:
+                    raise CommandError(f'ElasticSearch is unavailable: {e}')
+                self.stderr.write(f'ElasticSearch is unavailable, retrying in {options["interval"]}s')
+            except BulkIndexError as e:
+                # still rejected with 429 after all attempts, or failed in ElasticSearch
+                if not options['follow']:
+                    raise CommandError(f'Bulk load failed: {e}')
+                self.stderr.write(f'Bulk load failed: {e}, retrying in {options["interval"]}s')
+            else:
+                if loaded:
+                    self.stdout.write(f'Loaded {loaded} docs, {spool.backlog()} bytes left in the spool')
+            if not options['follow']:
+                return
+            time.sleep(options['interval'])
+
+    def load(self, chunk: List[dict]):
+        """Load a chunk of spooled actions and record the statistics of the indexed ones for `etl_status`"""
+        self.failed.clear()
+        started = time.perf_counter()
+        stats = self.bulk(chunk)
+        record_chunk([action for action in chunk if id(action) not in self.failed],
+                     time.perf_counter() - started, stats)
+
+    def dead_letter(self, failed: List[Tuple[dict, dict]]):
+        self.spool.dead_letter(failed)
+        self.failed.update(id(action) for action, _ in failed)
@@ -0,0 +1,48 @@
+import os
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from etl.spool import Spool
+from etl.stats import INDEX_MODELS, LAG_BUCKETS, backlog, recent_stats
+
+
+def _seconds(value: Optional[float]) -> str:
+    if value is None:
+        return '-'
+    if value == float('inf'):
+        return f'>{LAG_BUCKETS[-1]}s'
+    return f'≤{value}s'
+
+
+class Command(BaseCommand):
+    """
+    Show how stale ElasticSearch is: backlog and oldest unindexed change per index,
+    recent throughput and indexing lag percentiles.
+    Cheap enough to run while the ETL is busy: no `get_updated_*` aggregations are executed
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=15,
+                            help='Minutes of recent batches for throughput and lag percentiles')
+
+    def handle(self, *args, **options):
+        window = timedelta(minutes=options['window'])
+        now = timezone.now()
+        header = (f'{"index":<8} {"backlog":>9} {"oldest change":>20} {"docs/s":>8} {"lag p50":>9} {"lag p99":>9} '
+                  f'{"raw B/doc":>10} {"gzip B/doc":>10}')
+        self.stdout.write(header)
+        for index in INDEX_MODELS:
+            pending = backlog(index)
+            stats = recent_stats(index, window)
+            oldest = f'{(now - pending["oldest"]).total_seconds():.0f}s ago' if pending['oldest'] else '-'
+            docs = stats['docs'] or 1
+            self.stdout.write(f'{index:<8} {pending["count"]:>9} {oldest:>20} {stats["docs_per_second"]:>8.1f} '
+                              f'{_seconds(stats["p50"]):>9} {_seconds(stats["p99"]):>9} '
+                              f'{stats["raw_bytes"] // docs:>10} {stats["compressed_bytes"] // docs:>10}')
+
+        if os.path.isdir(settings.ETL_SPOOL_DIR):
+            spool = Spool(settings.ETL_SPOOL_DIR, settings.ETL_SPOOL_SEGMENT_SIZE)
+            self.stdout.write(f'spool: {len(spool.sealed_segments())} segments, {spool.backlog()} bytes to load')
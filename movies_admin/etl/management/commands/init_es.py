@@ -3,8 +3,8 @@ import os
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
-from elasticsearch import Elasticsearch
 
+from etl.es import get_es_client
 from movies.models import DATETIME_ANCIENT, FilmWork, Genre, Person
 
 
@@ -15,11 +15,7 @@ class Command(BaseCommand):
     `indexed_at` for all FilmWorks will be reset to default.
     """
     def handle(self, *args, **options):
-        config = {
-            'host': settings.ES_HOST,
-            'port': settings.ES_PORT,
-        }
-        es = Elasticsearch([config, ])
+        es = get_es_client()
         self._init_index(es, 'movies', 'etl/es_schema.json')
         self._init_index(es, 'persons', 'etl/es_schema_persons.json')
         self._init_index(es, 'genres', 'etl/es_schema_genres.json')
@@ -34,5 +30,6 @@ class Command(BaseCommand):
         with open(schema_dir) as f:
             request_body = json.load(f)
         if es.indices.exists(index=index_name):
-            es.indices.delete(index=index_name)
+            # after a rebuild the name is an alias of the rebuilt index
+            es.indices.delete(index=','.join(es.indices.get(index=index_name)))
         es.indices.create(index=index_name, body=request_body)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from etl.es import get_es_client
+from etl.reconcile import ReconcileStats, Reconciler
+from etl.stats import INDEX_MODELS
+
+
+class Command(BaseCommand):
+    """
+    Compare ElasticSearch indexes with Postgres by content hashes in one streaming pass:
+    delete orphaned documents, requeue missing and stale rows for the ETL
+    """
+    def add_arguments(self, parser):
+        parser.add_argument('--index', choices=INDEX_MODELS, action='append',
+                            help='Index to reconcile, may be repeated; all indexes by default')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Ids per page, per bulk delete and per requeue update')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the differences')
+
+    def handle(self, *args, **options):
+        es = get_es_client()
+        self.stdout.write(f'{"index":<8} ' + ' '.join(f'{field:>10}' for field in ReconcileStats._fields))
+        for index in options['index'] or INDEX_MODELS:
+            stats = Reconciler(es, index, options['batch_size'], options['dry_run']).run()
+            self.stdout.write(f'{index:<8} ' + ' '.join(f'{value:>10}' for value in stats))
@@ -1,12 +1,48 @@
+import os
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
 
 from etl.etl import ETL
+from etl.profiling import StageProfiler
+from etl.spool import Spool
 
 
 class Command(BaseCommand):
     """
     Start ETL process
     """
+    def add_arguments(self, parser):
+        parser.add_argument('--spool', action='store_true',
+                            help='Write documents to the on-disk spool, load them with `drain_spool`')
+        parser.add_argument('--mode', choices=settings.ETL_BULK_LIMITS, default='incremental',
+                            help='Bulk rate caps: `rebuild` allows a faster load of a full reindex')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Rebuild all indexes into fresh ones first, whatever the backlog')
+        parser.add_argument('--profile', action='store_true',
+                            help='Time every stage of every batch, see `etl.profiling`')
+        parser.add_argument('--profile-dir', default=os.path.join(settings.BASE_DIR, 'profile'),
+                            help='Directory for raw profiles')
+        parser.add_argument('--cprofile', action='store_true',
+                            help='With --profile, also capture a cProfile')
+        parser.add_argument('--sample', type=float, metavar='SECONDS',
+                            help='With --profile, also sample stacks every SECONDS for a flamegraph')
+
     def handle(self, *args, **options):
-        etl = ETL()
-        etl.start()
+        spool = Spool(settings.ETL_SPOOL_DIR, settings.ETL_SPOOL_SEGMENT_SIZE) if options['spool'] else None
+        if not options['profile']:
+            etl = ETL(spool=spool, mode=options['mode'], rebuild=options['rebuild'])
+            etl.start()
+            return
+
+        profiler = StageProfiler(options['profile_dir'], cprofile=options['cprofile'],
+                                 sample_interval=options['sample'])
+        etl = ETL(spool=spool, profiler=profiler, mode=options['mode'], rebuild=options['rebuild'])
+        try:
+            with profiler.capture():
+                etl.start()
+        finally:
+            for line in profiler.summary():
+                self.stdout.write(line)
+            for path in profiler.write():
+                self.stdout.write(f'Written {path}')
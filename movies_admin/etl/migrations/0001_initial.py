@@ -0,0 +1,36 @@
+# Generated by Django 3.2.3 on 2026-10-19 07:51
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.CharField(max_length=64, verbose_name='индекс')),
+                ('docs', models.PositiveIntegerField(verbose_name='документов')),
+                ('acked_at', models.DateTimeField(verbose_name='время подтверждения')),
+                ('bulk_seconds', models.FloatField(verbose_name='длительность bulk-запроса, с')),
+                ('max_lag', models.FloatField(verbose_name='максимальная задержка, с')),
+                ('lag_histogram', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), size=None, verbose_name='гистограмма задержек')),
+            ],
+            options={
+                'verbose_name': 'пакет индексации',
+                'verbose_name_plural': 'пакеты индексации',
+                'db_table': 'etl_index_batch',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='indexbatch',
+            index=models.Index(fields=['index', 'acked_at'], name='etl_index_b_index_baf745_idx'),
+        ),
+    ]
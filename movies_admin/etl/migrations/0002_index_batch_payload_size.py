@@ -0,0 +1,23 @@
+# Generated by Django 3.2.3 on 2026-10-19 07:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etl', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indexbatch',
+            name='compressed_bytes',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='объём запросов после сжатия, байт'),
+        ),
+        migrations.AddField(
+            model_name='indexbatch',
+            name='raw_bytes',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='объём запросов, байт'),
+        ),
+    ]
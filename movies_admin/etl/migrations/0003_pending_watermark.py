@@ -0,0 +1,25 @@
+# Generated by Django 3.2.3 on 2026-10-19 08:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('etl', '0002_index_batch_payload_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingWatermark',
+            fields=[
+                ('index', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='индекс')),
+                ('watermark', models.DateTimeField(verbose_name='начало переиндексации')),
+            ],
+            options={
+                'verbose_name': 'незавершённая переиндексация',
+                'verbose_name_plural': 'незавершённые переиндексации',
+                'db_table': 'etl_pending_watermark',
+            },
+        ),
+    ]
@@ -1,32 +1,41 @@
-from typing import List, Optional
-
-from pydantic import BaseModel
-
-
-class BasePerson(BaseModel):
-    id: str
-    full_name: str
-
-
-class BaseGenre(BaseModel):
-    id: str
-    name: str
-
-
-class Genre(BaseGenre):
-    description: str
-
-
-class FilmWorkES(BaseModel):
-    id: str
-    title: str
-    description: str
-    imdb_rating: Optional[float]
-    genres: List[BaseGenre]
-    genres_names: List[str]
-    writers_names: List[str]
-    actors_names: List[str]
-    directors_names: List[str]
-    writers: List[BasePerson]
-    actors: List[BasePerson]
-    directors: List[BasePerson]
+from django.contrib.postgres.fields import ArrayField
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class IndexBatch(models.Model):
+    """
+    Bulk request acknowledged by ElasticSearch, with the indexing lag of its documents:
+    the time from the source `last_modified` to the acknowledgement
+    """
+    index = models.CharField(_('индекс'), max_length=64)
+    docs = models.PositiveIntegerField(_('документов'))
+    acked_at = models.DateTimeField(_('время подтверждения'))
+    bulk_seconds = models.FloatField(_('длительность bulk-запроса, с'))
+    raw_bytes = models.PositiveBigIntegerField(_('объём запросов, байт'), default=0)
+    compressed_bytes = models.PositiveBigIntegerField(_('объём запросов после сжатия, байт'), default=0)
+    max_lag = models.FloatField(_('максимальная задержка, с'))
+    # document counts per `etl.stats.LAG_BUCKETS` bucket
+    lag_histogram = ArrayField(models.PositiveIntegerField(), verbose_name=_('гистограмма задержек'))
+
+    class Meta:
+        db_table = 'etl_index_batch'
+        verbose_name = _('пакет индексации')
+        verbose_name_plural = _('пакеты индексации')
+        indexes = (
+            models.Index(fields=('index', 'acked_at')),
+        )
+
+
+class PendingWatermark(models.Model):
+    """
+    Watermark of a rebuilt index, stored before its alias is swapped and deleted once `indexed_at`
+    is set to it, so changes indexed into the replaced index are requeued even after a crash in between
+    """
+    index = models.CharField(_('индекс'), max_length=64, primary_key=True)
+    watermark = models.DateTimeField(_('начало переиндексации'))
+
+    class Meta:
+        db_table = 'etl_pending_watermark'
+        verbose_name = _('незавершённая переиндексация')
+        verbose_name_plural = _('незавершённые переиндексации')
@@ -0,0 +1,131 @@
+"""
+Per-stage profiling of ETL runs, see `start_etl --profile`.
+
+Every batch is split into exclusive stage times:
+    sql        Postgres round trips of all queries, measured with execute wrappers of all connections
+    extract    extraction without its SQL: ORM hydration of rows and Python around it
+    transform  pydantic documents, the load stages called from the transform are timed apart
+    bulk       ElasticSearch bulk requests (`spool` instead in spool mode)
+    mark       marking rows as indexed, without its SQL
+Raw files written to the output directory:
+    batches.csv      stage times of every batch
+    queries.csv      text and time of every query
+    cprofile.pstats  with `--cprofile`, for `pstats` or snakeviz
+    stacks.folded    with `--sample`, wall-clock sampled collapsed stacks for flamegraph.pl or speedscope
+"""
+
+import cProfile
+import csv
+import os
+import signal
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from typing import List
+
+from django.db import connections
+
+STAGES = ('sql', 'extract', 'transform', 'bulk', 'spool', 'mark')
+
+
+class StageProfiler:
+    """Exclusive wall time per stage and batch; a nested stage pauses the enclosing one"""
+
+    def __init__(self, output_dir: str, cprofile: bool = False, sample_interval: float = None):
+        self.output_dir = output_dir
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.sample_interval = sample_interval
+        self.stacks = Counter()
+        self.batches = []
+        self.queries = []
+        self._times = defaultdict(float)
+        self._stack = []  # [stage, started] of the stages entered and not left
+
+    @contextmanager
+    def stage(self, name: str):
+        now = time.perf_counter()
+        if self._stack:
+            parent = self._stack[-1]
+            self._times[parent[0]] += now - parent[1]
+        self._stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self._times[name] += now - self._stack.pop()[1]
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def end_batch(self, pipeline: str, docs: int):
+        self.batches.append({'pipeline': pipeline, 'docs': docs,
+                             **{stage: self._times.get(stage, 0.0) for stage in STAGES}})
+        self._times.clear()
+
+    def _sql(self, execute, sql, params, many, context):
+        stage = self._stack[-1][0] if self._stack else ''
+        started = time.perf_counter()
+        try:
+            with self.stage('sql'):
+                return execute(sql, params, many, context)
+        finally:
+            self.queries.append((stage, (time.perf_counter() - started) * 1000, sql))
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    @contextmanager
+    def capture(self):
+        """Profile everything run inside the block"""
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self._sql))
+            if self.sample_interval:
+                # wall-clock timer: waits for Postgres and ElasticSearch show up in the stacks too
+                previous = signal.signal(signal.SIGALRM, self._sample)
+                signal.setitimer(signal.ITIMER_REAL, self.sample_interval, self.sample_interval)
+                stack.callback(signal.signal, signal.SIGALRM, previous)
+                stack.callback(signal.setitimer, signal.ITIMER_REAL, 0)
+            if self.cprofile:
+                self.cprofile.enable()
+                stack.callback(self.cprofile.disable)
+            yield
+
+    def write(self) -> List[str]:
+        """Write raw profiles, return their paths"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        paths = [os.path.join(self.output_dir, 'batches.csv'), os.path.join(self.output_dir, 'queries.csv')]
+        with open(paths[0], 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=('pipeline', 'docs') + STAGES)
+            writer.writeheader()
+            writer.writerows(self.batches)
+        with open(paths[1], 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('stage', 'ms', 'sql'))
+            writer.writerows(self.queries)
+        if self.cprofile:
+            paths.append(os.path.join(self.output_dir, 'cprofile.pstats'))
+            self.cprofile.dump_stats(paths[-1])
+        if self.sample_interval:
+            paths.append(os.path.join(self.output_dir, 'stacks.folded'))
+            with open(paths[-1], 'w') as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+        return paths
+
+    def summary(self) -> List[str]:
+        """Table of batches, documents and seconds per stage for every pipeline"""
+        lines = [f'{"pipeline":<8} {"batches":>7} {"docs":>8} ' + ' '.join(f'{stage:>9}' for stage in STAGES)]
+        totals = {}
+        for batch in self.batches:
+            total = totals.setdefault(batch['pipeline'], Counter())
+            total.update({key: value for key, value in batch.items() if key != 'pipeline'})
+            total['batches'] += 1 if batch['docs'] else 0
+        for pipeline, total in totals.items():
+            lines.append(f'{pipeline:<8} {total["batches"]:>7} {total["docs"]:>8} '
+                         + ' '.join(f'{total[stage]:>8.2f}s' for stage in STAGES))
+        return lines
@@ -0,0 +1,130 @@
+"""
+Full rebuilds of ElasticSearch indexes, chosen automatically when the backlog is large.
+
+After an outage or a mass import the incremental extraction would run its
+`ORDER BY last_modified LIMIT` query over and over; a rebuild scans all rows once instead:
+    1. the watermark is taken: the scan start, moved back by `ETL_REBUILD_WATERMARK_MARGIN`
+    2. all rows are streamed in primary key order into a fresh index `<index>_<timestamp>_<suffix>`,
+       created without refreshes and replicas
+    3. the watermark is stored as pending (`PendingWatermark`)
+    4. the index gets its refresh interval and replicas back and the alias `<index>` is swapped to it
+       in one atomic request that also deletes the previous index
+    5. `indexed_at` of all rows is set to the watermark and the pending one is deleted: changes made
+       since the scan started, including those indexed into the previous index meanwhile,
+       go to the incremental ETL again
+If the ETL dies between 3 and 5, the next start requeues the rows marked after the pending watermark.
+Only one ETL process rebuilds an index at a time; the others go on incrementally.
+"""
+
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict
+
+from django.db import connection, transaction
+from django.db.models import Model
+from django.utils import timezone
+
+from etl.models import PendingWatermark
+from etl.stats import INDEX_MODELS, pending_count
+
+if TYPE_CHECKING:
+    from elasticsearch import Elasticsearch
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_DIR = os.path.join(os.path.dirname(__file__), 'static', 'etl')
+SCHEMAS = {'movies': 'es_schema.json', 'persons': 'es_schema_persons.json', 'genres': 'es_schema_genres.json'}
+# partition number of the lease held by the process rebuilding an index, see `etl.leases`
+REBUILD_LEASE = -1
+
+
+def load_schema(index: str) -> dict:
+    with open(os.path.join(SCHEMA_DIR, SCHEMAS[index])) as f:
+        return json.load(f)
+
+
+def catalog_size(model: Model) -> int:
+    """Row count estimated by Postgres statistics, counted if the table was never analyzed"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        estimate = cursor.fetchone()[0]
+    return int(estimate) if estimate > 0 else model.objects.count()
+
+
+class BacklogMonitor:
+    """Decides when the backlog of an index is large enough for a rebuild; 0 threshold never does"""
+
+    def __init__(self, threshold: float, interval: float):
+        self.threshold = threshold
+        self.interval = interval
+        self._checked: Dict[str, float] = {}
+
+    def due(self, index: str) -> bool:
+        """Check the backlog of `index` unless it was checked less than `interval` seconds ago"""
+        if not self.threshold or index not in INDEX_MODELS:
+            return False
+        now = time.monotonic()
+        if now - self._checked.get(index, -self.interval) < self.interval:
+            return False
+        self._checked[index] = now
+        limit = int(catalog_size(INDEX_MODELS[index][0]) * self.threshold) + 1
+        # counting stops at the limit, a huge backlog costs no more than a moderate one
+        if pending_count(index, limit) < limit:
+            return False
+        logger.info(f'Backlog of {index} is over {self.threshold:.0%} of its rows, rebuilding')
+        return True
+
+
+def create_index(es: 'Elasticsearch', alias: str) -> str:
+    """Create a fresh index for `alias`, tuned for bulk loading, return its name"""
+    schema = load_schema(alias)
+    # the suffix keeps apart indexes created within the same second
+    name = f'{alias}_{timezone.now():%Y%m%d%H%M%S}_{uuid.uuid4().hex[:8]}'
+    settings = {**schema.get('settings', {}), 'refresh_interval': '-1', 'number_of_replicas': 0}
+    es.indices.create(index=name, body={**schema, 'settings': settings})
+    return name
+
+
+def publish_index(es: 'Elasticsearch', alias: str, index: str):
+    """Make the rebuilt `index` searchable and point `alias` to it, deleting the previous index"""
+    settings = load_schema(alias).get('settings', {})
+    es.indices.put_settings(index=index, body={'refresh_interval': settings.get('refresh_interval', '1s'),
+                                               'number_of_replicas': settings.get('number_of_replicas', 1)})
+    es.indices.refresh(index=index)
+    # before the first rebuild `alias` is the concrete index created by `init_es`
+    previous = list(es.indices.get(index=alias)) if es.indices.exists(index=alias) else []
+    actions = [{'add': {'index': index, 'alias': alias}}]
+    actions += [{'remove_index': {'index': name}} for name in previous]
+    es.indices.update_aliases(body={'actions': actions})
+
+
+def drop_index(es: 'Elasticsearch', index: str):
+    es.indices.delete(index=index, ignore=404)
+
+
+def store_watermark(index: str, watermark: datetime):
+    """Durably record the watermark of a rebuild of `index` before its alias is swapped"""
+    PendingWatermark.objects.update_or_create(index=index, defaults={'watermark': watermark})
+
+
+def apply_watermark(index: str, published: bool = True):
+    """
+    Set `indexed_at` to the pending watermark of `index`, if any, and delete it.
+    Unless the rebuilt index is known to be `published`, only rows marked after the watermark
+    are requeued: a rebuild that died before the swap left rows the live index never got
+    """
+    with transaction.atomic():
+        pending = PendingWatermark.objects.select_for_update().filter(index=index).first()
+        if pending is None:
+            return
+        rows = INDEX_MODELS[index][0].objects.all()
+        if not published:
+            rows = rows.filter(indexed_at__gt=pending.watermark)
+        count = rows.update(indexed_at=pending.watermark)
+        pending.delete()
+    if not published:
+        logger.warning(f'Unfinished rebuild of {index}: {count} rows indexed since {pending.watermark} requeued')
@@ -0,0 +1,136 @@
+"""
+Reconciliation of ElasticSearch indexes with Postgres, see `reconcile_es`.
+
+Both sides are streamed as (id, content hash) pairs sorted by id and merge-joined,
+so memory does not grow with the index size:
+    orphans     documents without a row, deleted from the index
+    missing     rows without a document, requeued for the ETL
+    mismatched  rows whose document has another hash, requeued for the ETL
+The uuid byte order of Postgres is the order of their lowercase text in ElasticSearch.
+
+The ElasticSearch point in time is opened before the Postgres query starts:
+a document indexed in between is never taken for an orphan, only a row may be requeued needlessly.
+"""
+
+import logging
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from elasticsearch import Elasticsearch
+
+from config.routers import has_replica, replica_reads, wait_for_replica
+from etl.bulk import BulkLoader
+from etl.hashing import genre_hash_sql, movie_hash_sql, person_hash_sql
+from etl.stats import INDEX_MODELS
+from movies.models import DATETIME_ANCIENT
+
+logger = logging.getLogger(__name__)
+
+HASH_SQL = {'movies': movie_hash_sql, 'persons': person_hash_sql, 'genres': genre_hash_sql}
+PIT_KEEP_ALIVE = '5m'
+
+
+class ReconcileStats(NamedTuple):
+    pg: int
+    es: int
+    matched: int
+    missing: int
+    mismatched: int
+    orphans: int
+
+
+def es_hashes(es: Elasticsearch, index: str, page_size: int) -> Iterator[Tuple[str, Optional[str]]]:
+    """Ids and content hashes of all documents sorted by id, paged with a point in time"""
+    pit_id = es.open_point_in_time(index=index, params={'keep_alive': PIT_KEEP_ALIVE})['id']
+    try:
+        body = {'size': page_size,
+                'sort': [{'id': 'asc'}],
+                '_source': False,
+                'docvalue_fields': ['id', 'content_hash'],
+                'track_total_hits': False}
+        while True:
+            response = es.search(body={**body, 'pit': {'id': pit_id, 'keep_alive': PIT_KEEP_ALIVE}})
+            pit_id = response['pit_id']
+            hits = response['hits']['hits']
+            for hit in hits:
+                # documents indexed before hashes were added have none
+                yield hit['fields']['id'][0], hit['fields'].get('content_hash', [None])[0]
+            if len(hits) < page_size:
+                return
+            body['search_after'] = hits[-1]['sort']
+    finally:
+        es.close_point_in_time(body={'id': pit_id})
+
+
+def pg_hashes(index: str, chunk_size: int) -> Iterator[Tuple[str, str]]:
+    """Ids and content hashes of all rows sorted by id, streamed with a server-side cursor"""
+    model = INDEX_MODELS[index][0]
+    qs = model.objects.annotate(content_hash=HASH_SQL[index]()).order_by('id').values_list('id', 'content_hash')
+    for pk, content_hash in qs.iterator(chunk_size=chunk_size):
+        yield str(pk), content_hash
+
+
+class Reconciler:
+    """Compares one index with its table, deletes orphans and requeues stale rows in batches"""
+
+    def __init__(self, es: Elasticsearch, index: str, batch_size: int = 1000, dry_run: bool = False,
+                 mode: str = 'rebuild'):
+        self.es = es
+        self.index = index
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.bulk = BulkLoader(es, mode)
+
+    def run(self) -> ReconcileStats:
+        counts = dict.fromkeys(ReconcileStats._fields, 0)
+        orphans, stale = [], []
+        # the point in time is opened by the first `next`, before the Postgres query
+        es = es_hashes(self.es, self.index, self.batch_size)
+        es_doc = next(es, None)
+        with replica_reads(has_replica() and wait_for_replica(settings.ETL_REPLICA_MAX_WAIT)):
+            pg = pg_hashes(self.index, self.batch_size)
+            pg_row = next(pg, None)
+            while es_doc or pg_row:
+                if pg_row is None or (es_doc and es_doc[0] < pg_row[0]):
+                    counts['es'] += 1
+                    counts['orphans'] += 1
+                    self._add(orphans, es_doc[0], self._delete)
+                    es_doc = next(es, None)
+                elif es_doc is None or pg_row[0] < es_doc[0]:
+                    counts['pg'] += 1
+                    counts['missing'] += 1
+                    self._add(stale, pg_row[0], self._requeue)
+                    pg_row = next(pg, None)
+                else:
+                    counts['pg'] += 1
+                    counts['es'] += 1
+                    if pg_row[1] == es_doc[1]:
+                        counts['matched'] += 1
+                    else:
+                        counts['mismatched'] += 1
+                        self._add(stale, pg_row[0], self._requeue)
+                    es_doc, pg_row = next(es, None), next(pg, None)
+        self._delete(orphans)
+        self._requeue(stale)
+        return ReconcileStats(**counts)
+
+    def _add(self, batch: List[str], pk: str, flush: Callable[[List[str]], None]):
+        batch.append(pk)
+        if len(batch) >= self.batch_size:
+            flush(batch)
+
+    def _delete(self, ids: List[str]):
+        """Delete orphaned documents, empties `ids`"""
+        if ids and not self.dry_run:
+            self.bulk([{'_op_type': 'delete', '_index': self.index, '_id': pk} for pk in ids])
+            logger.debug(f'{self.index}: {len(ids)} orphaned documents deleted')
+        ids.clear()
+
+    def _requeue(self, ids: List[str]):
+        """Make the ETL reindex rows `ids`, empties `ids`"""
+        if ids and not self.dry_run:
+            model = INDEX_MODELS[self.index][0]
+            # the write goes to the primary even inside `replica_reads`
+            model.objects.filter(id__in=ids).update(indexed_at=DATETIME_ANCIENT)
+            logger.debug(f'{self.index}: {len(ids)} rows requeued')
+        ids.clear()
@@ -0,0 +1,45 @@
+"""
+Compact rows passed from extraction to transformation.
+Plain tuples instead of model instances: no model state, no per-instance `__dict__`,
+only the attributes the transform actually reads
+"""
+
+from datetime import datetime
+from typing import TYPE_CHECKING, List, NamedTuple, Optional
+from uuid import UUID
+
+if TYPE_CHECKING:
+    from etl.documents import PersonFilm
+
+
+class MovieRow(NamedTuple):
+    id: UUID
+    title: str
+    description: str
+    imdb_rating: Optional[float]
+    last_modified: datetime
+    genres_ids: List[UUID]
+    genres_list: List[str]
+    actor_ids: List[UUID]
+    actor_names: List[str]
+    director_ids: List[UUID]
+    director_names: List[str]
+    writer_ids: List[UUID]
+    writer_names: List[str]
+
+
+class PersonRow(NamedTuple):
+    id: UUID
+    name: str
+    last_modified: datetime
+    films: List['PersonFilm']
+
+
+class GenreRow(NamedTuple):
+    id: UUID
+    genre: str
+    description: str
+    last_modified: datetime
+    film_count: int
+    avg_imdb_rating: Optional[float]
+    top_film_ids: List[UUID]
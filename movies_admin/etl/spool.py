@@ -0,0 +1,213 @@
+"""
+Durable on-disk spool between the ETL transform and load stages.
+
+Transformed bulk actions are appended to segmented, gzip-compressed NDJSON files,
+so Postgres extraction goes on while ElasticSearch is down or slow,
+and an independent loader (`drain_spool`) replays them at full bulk speed.
+
+Directory layout:
+    <time_ns>-<pid>.ndjson.gz.open  segment a writer is appending to, locked by the writer
+    <time_ns>-<pid>.ndjson.gz       sealed segments, loaded in name order
+    checkpoint.json                 how many actions of the first sealed segment are already loaded
+    drain.lock                      held by the loader, so only one drains the spool
+    dead_letter.ndjson              actions ElasticSearch rejected for good, with its errors
+
+Every append is one gzip member written and fsync-ed before the ETL marks the rows as indexed,
+a member torn by a crash is cut off when the orphaned segment is recovered.
+"""
+
+import fcntl
+import gzip
+import json
+import logging
+import os
+import time
+import zlib
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.ndjson.gz'
+OPEN_SUFFIX = SEGMENT_SUFFIX + '.open'
+CHECKPOINT = 'checkpoint.json'
+DRAIN_LOCK = 'drain.lock'
+DEAD_LETTER = 'dead_letter.ndjson'
+READ_SIZE = 1024 * 1024
+
+
+class SpoolBusy(Exception):
+    """Another loader is draining the spool"""
+
+
+def _valid_length(f: BinaryIO) -> int:
+    """Length of the leading complete gzip members in file `f`"""
+    valid = consumed = 0
+    decompressor = zlib.decompressobj(wbits=31)
+    while True:
+        chunk = f.read(READ_SIZE)
+        if not chunk:
+            return valid
+        while chunk:
+            decompressor.decompress(chunk)
+            if not decompressor.eof:
+                consumed += len(chunk)
+                break
+            # a member ended inside the chunk, the rest of the chunk starts the next one
+            tail = decompressor.unused_data
+            consumed += len(chunk) - len(tail)
+            valid = consumed
+            decompressor = zlib.decompressobj(wbits=31)
+            chunk = tail
+
+
+def _fsync_dir(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Spool:
+    """Segmented append-only queue of bulk actions; one writer per process, one loader"""
+
+    def __init__(self, directory: str, segment_size: int):
+        self.directory = directory
+        self.segment_size = segment_size
+        self._segment = None  # file object of this process' open segment
+        os.makedirs(directory, exist_ok=True)
+
+    # writer side
+
+    def append(self, actions: List[dict]):
+        """Durably append bulk actions as one gzip member"""
+        if not actions:
+            return
+        if self._segment is None:
+            self._recover()
+            self._open_segment()
+        lines = b''.join(json.dumps(action, ensure_ascii=False).encode() + b'\n' for action in actions)
+        self._segment.write(zlib.compress(lines, wbits=31))
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+        if self._segment.tell() >= self.segment_size:
+            self.seal()
+
+    def seal(self):
+        """Hand the open segment over to the loader"""
+        if self._segment is None:
+            return
+        path = self._segment.name
+        os.replace(path, path[:-len('.open')])
+        _fsync_dir(self.directory)
+        self._segment.close()  # releases the lock
+        self._segment = None
+
+    def _open_segment(self):
+        name = f'{time.time_ns():020d}-{os.getpid()}{OPEN_SUFFIX}'
+        self._segment = open(os.path.join(self.directory, name), 'ab')
+        fcntl.flock(self._segment.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        _fsync_dir(self.directory)
+
+    def _recover(self):
+        """Seal open segments left by crashed writers, cutting off a torn last member"""
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(OPEN_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            with open(path, 'r+b') as f:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # its writer is alive
+                length = _valid_length(f)
+                size = f.seek(0, os.SEEK_END)
+                if length < size:
+                    logger.warning(f'Spool segment {name}: dropped {size - length} bytes of a torn write')
+                    f.truncate(length)
+                    os.fsync(f.fileno())
+                os.replace(path, path[:-len('.open')])
+            _fsync_dir(self.directory)
+
+    # loader side
+
+    def sealed_segments(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+
+    def backlog(self) -> int:
+        """Compressed bytes waiting to be loaded"""
+        return sum(os.path.getsize(os.path.join(self.directory, name)) for name in self.sealed_segments())
+
+    @contextmanager
+    def _drain_lock(self):
+        with open(os.path.join(self.directory, DRAIN_LOCK), 'w') as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise SpoolBusy(self.directory)
+            yield
+
+    def _read_checkpoint(self) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_checkpoint(self, segment: str, offset: int):
+        path = os.path.join(self.directory, CHECKPOINT)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'segment': segment, 'offset': offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def dead_letter(self, failed: List[Tuple[dict, dict]]):
+        """
+        Set aside actions rejected for good with their bulk response items, so the drain moves on;
+        fix the cause and load them again from the file
+        """
+        with open(os.path.join(self.directory, DEAD_LETTER), 'a') as f:
+            for action, item in failed:
+                result = next(iter(item.values()))
+                logger.error(f'Spool: {result.get("_index")}/{result.get("_id")} rejected '
+                             f'with {result["status"]}: {result.get("error")}')
+                f.write(json.dumps({'action': action, 'item': item}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def drain(self, load: Callable[[List[dict]], None], chunk_size: int) -> int:
+        """
+        Load all sealed segments with `load`, `chunk_size` actions per call.
+        The position is checkpointed after every chunk, so a crashed or failed drain
+        resumes where it stopped; a chunk may be loaded twice, which is harmless for versioned bulk `index`.
+        Returns the number of loaded actions.
+        """
+        loaded = 0
+        with self._drain_lock():
+            for name in self.sealed_segments():
+                checkpoint = self._read_checkpoint()
+                skip = checkpoint['offset'] if checkpoint and checkpoint['segment'] == name else 0
+                path = os.path.join(self.directory, name)
+
+                offset, chunk = 0, []
+                # gzip reads concatenated members as one stream
+                with gzip.open(path, 'rb') as f:
+                    for line in f:
+                        offset += 1
+                        if offset <= skip:
+                            continue
+                        chunk.append(json.loads(line))
+                        if len(chunk) >= chunk_size:
+                            load(chunk)
+                            loaded += len(chunk)
+                            chunk = []
+                            self._write_checkpoint(name, offset)
+                if chunk:
+                    load(chunk)
+                    loaded += len(chunk)
+                    self._write_checkpoint(name, offset)
+                os.remove(path)
+                logger.debug(f'Spool segment {name} loaded')
+        return loaded
@@ -0,0 +1,106 @@
+"""
+Indexing lag and backlog statistics of the ETL
+"""
+
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from django.db.models import Exists, F, Min, OuterRef, Q
+from django.utils import timezone
+
+from etl.models import IndexBatch
+from movies.models import FilmWork, FilmWorkGenre, FilmWorkPerson, Genre, Person
+
+# upper bounds of the lag histogram buckets in seconds, the last bucket is unbounded
+LAG_BUCKETS = (1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 24 * 3600, 7 * 24 * 3600)
+
+# models behind every index and the m2m tables whose changes reindex them
+INDEX_MODELS = {
+    'movies': (FilmWork, ((FilmWorkPerson, 'film_work'), (FilmWorkGenre, 'film_work'))),
+    'persons': (Person, ((FilmWorkPerson, 'person'), )),
+    'genres': (Genre, ((FilmWorkGenre, 'genre'), )),
+}
+
+
+def lag_histogram(lags: List[float]) -> List[int]:
+    histogram = [0] * (len(LAG_BUCKETS) + 1)
+    for lag in lags:
+        histogram[bisect_left(LAG_BUCKETS, lag)] += 1
+    return histogram
+
+
+def histogram_percentile(histogram: List[int], q: float) -> Optional[float]:
+    """Upper bound of the bucket holding the `q` percentile, infinity for the unbounded bucket, None if empty"""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = total * q / 100
+    seen = 0
+    for bound, count in zip(LAG_BUCKETS, histogram):
+        seen += count
+        if seen >= rank:
+            return bound
+    return float('inf')
+
+
+def record_batch(index: str, last_modified: List[datetime], bulk_seconds: float,
+                 raw_bytes: int = 0, compressed_bytes: int = 0):
+    """Store lag and payload statistics of a bulk load acknowledged just now"""
+    acked_at = timezone.now()
+    lags = [(acked_at - modified).total_seconds() for modified in last_modified]
+    IndexBatch.objects.create(index=index,
+                              docs=len(lags),
+                              acked_at=acked_at,
+                              bulk_seconds=bulk_seconds,
+                              raw_bytes=raw_bytes,
+                              compressed_bytes=compressed_bytes,
+                              max_lag=max(lags, default=0),
+                              lag_histogram=lag_histogram(lags))
+
+
+def prune_batches(retention: timedelta) -> int:
+    return IndexBatch.objects.filter(acked_at__lt=timezone.now() - retention).delete()[0]
+
+
+def recent_stats(index: str, window: timedelta) -> dict:
+    """Throughput, payload sizes and lag percentiles of the batches acknowledged within `window`"""
+    batches = IndexBatch.objects.filter(index=index, acked_at__gte=timezone.now() - window)
+    histogram = [0] * (len(LAG_BUCKETS) + 1)
+    docs = raw_bytes = compressed_bytes = 0
+    for row in batches.values_list('docs', 'raw_bytes', 'compressed_bytes', 'lag_histogram'):
+        docs += row[0]
+        raw_bytes += row[1]
+        compressed_bytes += row[2]
+        histogram = [a + b for a, b in zip(histogram, row[3])]
+    return {'docs': docs,
+            'docs_per_second': docs / window.total_seconds(),
+            'raw_bytes': raw_bytes,
+            'compressed_bytes': compressed_bytes,
+            'p50': histogram_percentile(histogram, 50),
+            'p99': histogram_percentile(histogram, 99)}
+
+
+def backlog(index: str) -> dict:
+    """
+    Documents waiting for reindexing and the oldest unindexed change, estimated without
+    the `get_updated_*` aggregations: entities changed themselves or with changed m2m rows.
+    Renames of related entities are not counted
+    """
+    model, relations = INDEX_MODELS[index]
+    oldest = [model.objects.filter(modified__gt=F('indexed_at')).aggregate(oldest=Min('modified'))['oldest']]
+    for through, entity in relations:
+        relation_changes = through.objects.filter(modified__gt=F(f'{entity}__indexed_at'))
+        oldest.append(relation_changes.aggregate(oldest=Min('modified'))['oldest'])
+    return {'count': pending_count(index),
+            'oldest': min((change for change in oldest if change), default=None)}
+
+
+def pending_count(index: str, limit: Optional[int] = None) -> int:
+    """Number of entities `backlog` counts as waiting; counting stops at `limit`"""
+    model, relations = INDEX_MODELS[index]
+    changed = Q(modified__gt=F('indexed_at'))
+    for through, entity in relations:
+        changed |= Exists(through.objects.filter(**{entity: OuterRef('pk')}, modified__gt=OuterRef('indexed_at')))
+    qs = model.objects.filter(changed)
+    return qs[:limit].count() if limit is not None else qs.count()
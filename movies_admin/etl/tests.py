@@ -0,0 +1,378 @@
+import json
+import os
+import tempfile
+import zlib
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from elasticsearch import ConnectionError
+
+from etl.bulk import ES_MAX_RECONNECTIONS, BulkLoader, BulkStats, document_version
+from etl.etl import ETL
+from etl.management.commands.drain_spool import record_chunk
+from etl.hashing import genre_hash, movie_hash, person_hash
+from etl.reconcile import pg_hashes
+from etl.spool import CHECKPOINT, DEAD_LETTER, OPEN_SUFFIX, SEGMENT_SUFFIX, Spool
+from etl.models import IndexBatch
+from etl.throttle import BulkThrottle
+from movies.models import FilmWork, FilmWorkGenre, FilmWorkPerson, Genre, Person, PersonJob
+
+
+class FakeES:
+    """ElasticSearch client answering bulk requests with the queued item statuses, all 200 when none are left"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.bodies = []
+        self.transport = self
+
+    def perform_request(self, method, url, headers=None, body=None):
+        lines = zlib.decompress(body, wbits=31).splitlines()
+        actions = [json.loads(line) for line in lines if set(json.loads(line)) & {'index', 'delete'}]
+        self.bodies.append(actions)
+        response = self.responses.pop(0) if self.responses else None
+        if isinstance(response, Exception):
+            raise response
+        statuses = response or [200] * len(actions)
+        items = [{next(iter(action)): {**next(iter(action.values())), 'status': status}}
+                 for action, status in zip(actions, statuses)]
+        return {'errors': any(status >= 300 for status in statuses), 'items': items}
+
+
+def member(*actions: dict) -> bytes:
+    """One spool append: a gzip member of NDJSON lines"""
+    return zlib.compress(b''.join(json.dumps(action).encode() + b'\n' for action in actions), wbits=31)
+
+
+class SpoolTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.spool = Spool(self.directory, segment_size=1024 * 1024)
+
+    def files(self, suffix: str):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(suffix))
+
+    def drain_all(self, chunk_size: int = 2):
+        loaded = []
+        self.spool.drain(loaded.extend, chunk_size)
+        return loaded
+
+    def test_recover_cuts_off_torn_write(self):
+        path = os.path.join(self.directory, f'{1:020d}-1{OPEN_SUFFIX}')
+        with open(path, 'wb') as f:
+            f.write(member({'n': 1}) + member({'n': 2}) + member({'n': 3})[:-5])
+
+        with self.assertLogs('etl.spool', 'WARNING'):
+            self.spool._recover()
+
+        self.assertEqual(self.files(OPEN_SUFFIX), [])
+        self.assertEqual(self.files(SEGMENT_SUFFIX), [f'{1:020d}-1{SEGMENT_SUFFIX}'])
+        self.assertEqual(self.drain_all(), [{'n': 1}, {'n': 2}])
+
+    def test_recover_keeps_segment_of_live_writer(self):
+        self.spool.append([{'n': 1}])
+
+        Spool(self.directory, segment_size=1024 * 1024)._recover()
+
+        self.assertEqual(len(self.files(OPEN_SUFFIX)), 1)
+        self.assertEqual(self.files(SEGMENT_SUFFIX), [])
+
+    def test_drain_resumes_from_checkpoint(self):
+        self.spool.append([{'n': n} for n in range(1, 6)])
+        self.spool.seal()
+        loaded = []
+
+        def fail_second_chunk(chunk):
+            if loaded:
+                raise ConnectionError
+            loaded.extend(chunk)
+
+        with self.assertRaises(ConnectionError):
+            self.spool.drain(fail_second_chunk, chunk_size=2)
+        with open(os.path.join(self.directory, CHECKPOINT)) as f:
+            self.assertEqual(json.load(f)['offset'], 2)
+
+        self.assertEqual(self.drain_all(), [{'n': 3}, {'n': 4}, {'n': 5}])
+        self.assertEqual(self.files(SEGMENT_SUFFIX), [])
+
+    def test_checkpoint_of_loaded_segment_is_ignored(self):
+        self.spool.append([{'n': 1}, {'n': 2}, {'n': 3}])
+        self.spool.seal()
+        self.drain_all()
+        self.spool.append([{'n': 4}, {'n': 5}])
+        self.spool.seal()
+
+        self.assertEqual(self.drain_all(), [{'n': 4}, {'n': 5}])
+
+    def test_segments_are_loaded_in_order(self):
+        for n in range(1, 4):
+            self.spool.append([{'n': n}])
+            self.spool.seal()
+
+        self.assertEqual(self.drain_all(chunk_size=10), [{'n': 1}, {'n': 2}, {'n': 3}])
+
+    def test_dead_letter_keeps_action_and_error(self):
+        action = {'_index': 'movies', '_id': '1', 'title': 'Сталкер'}
+        item = {'index': {'_index': 'movies', '_id': '1', 'status': 400,
+                          'error': {'type': 'mapper_parsing_exception'}}}
+
+        with self.assertLogs('etl.spool', 'ERROR'):
+            self.spool.dead_letter([(action, item)])
+
+        with open(os.path.join(self.directory, DEAD_LETTER)) as f:
+            self.assertEqual([json.loads(line) for line in f], [{'action': action, 'item': item}])
+
+
+class BulkThrottleTests(SimpleTestCase):
+
+    def setUp(self):
+        self.throttle = BulkThrottle(docs_per_second=1000, bytes_per_second=0)
+
+    def test_rejections_halve_the_rate_down_to_the_floor(self):
+        self.throttle.feedback(100, 0.1, rejected=5)
+        self.assertEqual(self.throttle.factor, 0.5)
+        for _ in range(10):
+            self.throttle.feedback(100, 0.1, rejected=5)
+        self.assertEqual(self.throttle.factor, BulkThrottle.MIN_FACTOR)
+
+    def test_smooth_requests_recover_the_rate_additively(self):
+        self.throttle.feedback(100, 0.1, rejected=1)
+        self.throttle.feedback(100, 0.1, rejected=0)
+        self.assertAlmostEqual(self.throttle.factor, 0.5 + BulkThrottle.INCREASE)
+        for _ in range(20):
+            self.throttle.feedback(100, 0.1, rejected=0)
+        self.assertEqual(self.throttle.factor, 1.0)
+
+    def test_slowdown_halves_the_rate(self):
+        self.throttle.feedback(100, 0.1, rejected=0)
+        self.throttle.feedback(100, 0.1 * BulkThrottle.SLOWDOWN * 1.1, rejected=0)
+        self.assertEqual(self.throttle.factor, 0.5)
+
+    def test_slow_requests_do_not_shift_the_usual_latency(self):
+        self.throttle.feedback(100, 0.1, rejected=0)
+        for _ in range(3):
+            self.throttle.feedback(100, 1.0, rejected=0)
+        self.assertAlmostEqual(self.throttle._usual_latency, 0.001)
+        self.assertEqual(self.throttle.factor, 0.5 ** 3)
+
+    def test_latency_is_compared_per_document(self):
+        self.throttle.feedback(100, 0.1, rejected=0)
+        self.throttle.feedback(1000, 0.5, rejected=0)
+        self.assertEqual(self.throttle.factor, 1.0)
+
+    @mock.patch('etl.throttle.time')
+    def test_pace_spaces_requests_by_the_scaled_caps(self, time):
+        time.monotonic.return_value = 100.0
+        throttle = BulkThrottle(docs_per_second=1000, bytes_per_second=1000)
+        throttle.pace(100, 500)  # 0.5s by bytes, the slower cap wins
+        time.sleep.assert_not_called()
+
+        throttle.feedback(100, 0.1, rejected=1)
+        throttle.pace(100, 10)
+        time.sleep.assert_called_once_with(0.5)
+        throttle.pace(100, 10)  # 0.2s by docs at half the rate
+        self.assertAlmostEqual(time.sleep.call_args[0][0], 0.7)
+
+    @mock.patch('etl.throttle.time')
+    def test_zero_caps_disable_pacing(self, time):
+        time.monotonic.return_value = 100.0
+        throttle = BulkThrottle(docs_per_second=0, bytes_per_second=0)
+        for _ in range(3):
+            throttle.pace(10_000, 10 ** 9)
+        time.sleep.assert_not_called()
+
+
+class BulkLoaderTests(SimpleTestCase):
+
+    def loader(self, es: FakeES) -> BulkLoader:
+        loader = BulkLoader(es)
+        loader.throttle = BulkThrottle(docs_per_second=0, bytes_per_second=0)
+        return loader
+
+    @mock.patch('etl.throttle.time')
+    def test_rejected_docs_are_resent_after_a_backoff_without_caps(self, time):
+        time.monotonic.return_value = 100.0
+        es = FakeES([429, 200], [429], [200])
+        actions = [{'_index': 'movies', '_id': str(n), 'title': str(n)} for n in range(2)]
+
+        with self.assertLogs('etl.bulk', 'WARNING'):
+            stats = self.loader(es)(actions)
+
+        self.assertEqual(stats.requests, 3)
+        self.assertEqual([len(body) for body in es.bodies], [2, 1, 1])
+        delays = [call[0][0] for call in time.sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(BulkThrottle.RETRY_DELAY / 2 <= delays[0] <= BulkThrottle.RETRY_DELAY)
+        self.assertTrue(BulkThrottle.RETRY_DELAY <= delays[1] <= BulkThrottle.RETRY_DELAY * 2)
+
+    @mock.patch('etl.throttle.time')
+    def test_backoff_is_capped(self, time):
+        BulkThrottle(0, 0).backoff(100)
+        self.assertLessEqual(time.sleep.call_args[0][0], BulkThrottle.MAX_RETRY_DELAY)
+
+    def test_version_conflict_is_success(self):
+        es = FakeES([409])
+        stats = self.loader(es)([{'_index': 'movies', '_id': '1', '_version': 1, '_version_type': 'external_gte'}])
+        self.assertEqual(stats.requests, 1)
+
+
+class StopDraining(Exception):
+    pass
+
+
+class DrainSpoolTests(SimpleTestCase):
+    """`drain_spool` against a fake ElasticSearch, batch statistics are not recorded"""
+    INTERVAL = 7.5
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        spool_settings = override_settings(ETL_SPOOL_DIR=self.directory)
+        spool_settings.enable()
+        self.addCleanup(spool_settings.disable)
+        self.record_chunk = mock.patch('etl.management.commands.drain_spool.record_chunk').start()
+        self.addCleanup(mock.patch.stopall)
+        self.spool = Spool(self.directory, segment_size=1024 * 1024)
+
+    def spool_actions(self, count: int):
+        self.spool.append([{'_index': 'movies', '_id': str(n), 'title': str(n)} for n in range(count)])
+        self.spool.seal()
+
+    def drain(self, es: FakeES, intervals: int = 0, **options):
+        """Run the command, with `--follow` stopped at its `intervals`-th wait"""
+        waits = []
+
+        def sleep(seconds):
+            if seconds == self.INTERVAL:
+                waits.append(seconds)
+                if len(waits) >= intervals:
+                    raise StopDraining
+
+        out, err = StringIO(), StringIO()
+        with mock.patch('etl.management.commands.drain_spool.get_es_client', return_value=es), \
+                mock.patch('time.sleep', side_effect=sleep):
+            try:
+                call_command('drain_spool', interval=self.INTERVAL, stdout=out, stderr=err, **options)
+            except StopDraining:
+                pass
+        return out.getvalue(), err.getvalue()
+
+    def test_follow_survives_outage_and_rejections(self):
+        self.spool_actions(2)
+        down = ConnectionError('N/A', 'connection refused', Exception())
+        es = FakeES(*[down] * ES_MAX_RECONNECTIONS, *[[429, 429]] * ES_MAX_RECONNECTIONS)
+        with self.assertLogs('etl.bulk', 'WARNING'):
+            out, err = self.drain(es, intervals=3, follow=True)
+
+        self.assertIn('ElasticSearch is unavailable', err)
+        self.assertIn('Bulk load failed', err)
+        self.assertIn('Loaded 2 docs', out)
+        # every failed attempt of both drains, then the one that goes through
+        self.assertEqual(len(es.bodies), 2 * ES_MAX_RECONNECTIONS + 1)
+        self.assertEqual(len(es.bodies[-1]), 2)
+        self.assertEqual(self.spool.sealed_segments(), [])
+
+    def test_outage_fails_without_follow(self):
+        self.spool_actions(1)
+        down = ConnectionError('N/A', 'connection refused', Exception())
+        with self.assertRaisesMessage(CommandError, 'unavailable'):
+            self.drain(FakeES(*[down] * ES_MAX_RECONNECTIONS))
+        self.assertEqual(len(self.spool.sealed_segments()), 1)
+
+    def test_rejected_actions_are_dead_lettered_and_checkpointed(self):
+        self.spool_actions(3)
+        es = FakeES([200, 400])
+        with self.assertLogs('etl.spool', 'ERROR'):
+            out, _ = self.drain(es, chunk_size=2)
+
+        self.assertIn('Loaded 3 docs', out)
+        self.assertEqual(self.spool.sealed_segments(), [])
+        with open(os.path.join(self.directory, DEAD_LETTER)) as f:
+            self.assertEqual([json.loads(line)['action']['_id'] for line in f], ['1'])
+        # the rejected action is not counted as indexed
+        recorded = [[action['_id'] for action in call[0][0]] for call in self.record_chunk.call_args_list]
+        self.assertEqual(recorded, [['0'], ['2']])
+
+        # a second drain does not replay anything
+        self.drain(es, chunk_size=2)
+        self.assertEqual(len(es.bodies), 2)
+
+
+class RecordChunkTests(TestCase):
+
+    def test_batch_per_index_with_lags_from_versions(self):
+        modified = timezone.now() - timedelta(minutes=10)
+        actions = [{'_index': 'movies', '_id': '1', **document_version(modified)},
+                   {'_index': 'movies', '_id': '2', **document_version(modified)},
+                   {'_index': 'persons', '_id': '3', **document_version(modified)},
+                   {'_index': 'persons', '_id': '4'}]  # spooled before versioning
+
+        record_chunk(actions, 2.0, BulkStats(1, 400, 100))
+
+        movies, persons = IndexBatch.objects.get(index='movies'), IndexBatch.objects.get(index='persons')
+        self.assertEqual((movies.docs, movies.raw_bytes, movies.compressed_bytes, movies.bulk_seconds),
+                         (2, 200, 50, 1.0))
+        self.assertEqual(persons.docs, 1)
+        self.assertGreaterEqual(movies.max_lag, 600)
+
+
+class ContentHashTests(TestCase):
+    """Hashes Postgres computes for `reconcile_es` are the ones the ETL stores in the documents"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.drama = drama = Genre.objects.create(genre='драма')
+        fiction = Genre.objects.create(genre='Science fiction', description='Фантастика «Ёлки»')
+        Genre.objects.create(genre='документальный')  # no films
+        tarkovsky = Person.objects.create(name='Андрей Тарковский')
+        strugatsky = Person.objects.create(name='Аркадий Стругацкий')
+        banionis = Person.objects.create(name='Donatas Banionis')
+        Person.objects.create(name='Станислав Лем')  # no films
+
+        stalker = FilmWork.objects.create(title='Сталкер', imdb_rating=8.1)
+        solaris = FilmWork.objects.create(title='Солярис', description='По роману Станислава Лема',
+                                          imdb_rating=None)
+        FilmWork.objects.create(title='Ёжик в тумане', imdb_rating=0.29)  # no relations, 28.999… hundredths
+        mirror = FilmWork.objects.create(title='Зеркало', imdb_rating=7.3)  # drama averages 7.699…
+        for film, person, job in ((stalker, tarkovsky, PersonJob.DIRECTOR),
+                                  (stalker, tarkovsky, PersonJob.WRITER),
+                                  (stalker, strugatsky, PersonJob.WRITER),
+                                  (solaris, tarkovsky, PersonJob.DIRECTOR),
+                                  (solaris, banionis, PersonJob.ACTOR)):
+            FilmWorkPerson.objects.create(film_work=film, person=person, job=job)
+        for film, genre in ((stalker, drama), (mirror, drama), (stalker, fiction), (solaris, fiction)):
+            FilmWorkGenre.objects.create(film_work=film, genre=genre)
+
+    def assertHashesMatch(self, index: str, rows: list, python_hash):
+        self.assertEqual(dict(pg_hashes(index, chunk_size=100)),
+                         {str(row.id): python_hash(row) for row in rows})
+
+    def test_movies(self):
+        self.assertHashesMatch('movies', ETL(batch_size=100).get_updated_movies(), movie_hash)
+
+    def test_movies_normalized(self):
+        rows = ETL(batch_size=100, movies_extraction='normalized').get_updated_movies()
+        self.assertHashesMatch('movies', rows, movie_hash)
+
+    def test_persons(self):
+        self.assertHashesMatch('persons', ETL(batch_size=100).get_updated_perons(), person_hash)
+
+    def test_genres(self):
+        self.assertHashesMatch('genres', ETL(batch_size=100).get_updated_genres(), genre_hash)
+
+    def test_genre_hash_covers_statistics(self):
+        before = dict(pg_hashes('genres', chunk_size=100))
+        # moves the average of drama and puts the film on top of it
+        FilmWork.objects.filter(title='Зеркало').update(imdb_rating=9.9)
+
+        after = dict(pg_hashes('genres', chunk_size=100))
+        self.assertNotEqual(after[str(self.drama.id)], before[str(self.drama.id)])
+        self.assertHashesMatch('genres', ETL(batch_size=100).get_updated_genres(), genre_hash)
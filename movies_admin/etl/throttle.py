@@ -0,0 +1,66 @@
+"""
+Adaptive rate control of ElasticSearch bulk requests.
+
+Bulk requests are paced to stay under a documents per second and a bytes per second cap.
+The caps are scaled by a factor that follows AIMD, like TCP congestion control:
+it is halved when ElasticSearch rejects documents (429) or a request is much slower
+per document than usual, and recovers additively while requests go through smoothly.
+A saturated cluster thus gets room to serve live search instead of being hammered.
+Rejected documents are resent only after a backoff that grows with every attempt,
+even when the caps are disabled.
+"""
+
+import random
+import time
+
+
+class BulkThrottle:
+    """Pacing of bulk requests under adaptive docs/s and bytes/s caps; a cap of 0 disables it"""
+
+    MIN_FACTOR = 0.05
+    INCREASE = 0.05
+    DECREASE = 0.5
+    # a request slower per document than this many times the usual is a sign of overload
+    SLOWDOWN = 2.0
+    # weight of the latest healthy request in the usual per document latency
+    EWMA_WEIGHT = 0.2
+    # pause before the first resend of rejected documents, doubled with every further attempt
+    RETRY_DELAY = 0.5
+    MAX_RETRY_DELAY = 30.0
+
+    def __init__(self, docs_per_second: float, bytes_per_second: float):
+        self.docs_per_second = docs_per_second
+        self.bytes_per_second = bytes_per_second
+        self.factor = 1.0
+        self._usual_latency = None  # seconds per document
+        self._next_send = time.monotonic()
+
+    def pace(self, docs: int, size: int):
+        """Sleep until a request of `docs` documents and `size` bytes fits under the caps"""
+        duration = 0.0
+        if self.docs_per_second:
+            duration = max(duration, docs / (self.docs_per_second * self.factor))
+        if self.bytes_per_second:
+            duration = max(duration, size / (self.bytes_per_second * self.factor))
+        now = time.monotonic()
+        if self._next_send > now:
+            time.sleep(self._next_send - now)
+        self._next_send = max(now, self._next_send) + duration
+
+    def feedback(self, docs: int, seconds: float, rejected: int):
+        """Adjust the caps after a request of `docs` documents took `seconds` and had `rejected` 429s"""
+        latency = seconds / max(docs, 1)
+        if rejected or (self._usual_latency and latency > self._usual_latency * self.SLOWDOWN):
+            self.factor = max(self.MIN_FACTOR, self.factor * self.DECREASE)
+            return
+        self.factor = min(1.0, self.factor + self.INCREASE)
+        if self._usual_latency is None:
+            self._usual_latency = latency
+        else:
+            self._usual_latency += self.EWMA_WEIGHT * (latency - self._usual_latency)
+
+    def backoff(self, attempt: int):
+        """Sleep before resending documents rejected on attempt `attempt` (from 0), with jitter"""
+        delay = min(self.MAX_RETRY_DELAY, self.RETRY_DELAY * 2 ** attempt)
+        # at least half of the delay, so retries of concurrent loaders spread out but never rush
+        time.sleep(delay / 2 + random.uniform(0, delay / 2))
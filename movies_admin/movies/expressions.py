@@ -0,0 +1,28 @@
+"""
+Query expressions shared by the API and the ETL
+"""
+
+from django.contrib.postgres.fields import ArrayField
+from django.db.models import Func, Subquery
+
+
+class ArraySubquery(Subquery):
+    """
+    Collect a single-column subquery into a Postgres array: `ARRAY(SELECT ...)`.
+    Backport of `django.contrib.postgres.expressions.ArraySubquery` (Django 4.0).
+
+    Unlike `ArrayAgg` over joins it needs no GROUP BY on the outer query,
+    so several of them never multiply each other's rows.
+    """
+    template = 'ARRAY(%(subquery)s)'
+
+    def _resolve_output_field(self):
+        return ArrayField(self.query.output_field)
+
+
+class ArraySlice(Func):
+    """First `length` items of an array expression: `(array)[1:length]`"""
+    template = '(%(expressions)s)[1:%(length)d]'
+
+    def __init__(self, expression, length: int, **extra):
+        super().__init__(expression, length=length, **extra)
@@ -0,0 +1,202 @@
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from typing import Callable, Dict, List, NamedTuple
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client
+
+from api.v1.views import PAGE_SIZE
+from config.routers import has_replica, wait_for_replica
+from movies.benchmarks import delete_catalog, percentile, seed_catalog
+from movies.models import FilmWork
+
+SCENARIOS = ('first', 'middle', 'deep', 'last', 'detail')
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'api_budget.json')
+
+
+class Sample(NamedTuple):
+    ms: float
+    queries: int
+    sql_ms: float
+    bytes: int
+
+
+class Command(BaseCommand):
+    """
+    Load-test the movies API in process: seed catalogs of growing scale, drive concurrent
+    requests through the Django test client (full middleware and URL routing, no HTTP server)
+    and report latency percentiles, SQL queries and time, and response size per request.
+
+    Scenarios: the first, a middle, a deep (90%) and the `last` list pages, and detail lookups.
+    `cold` requests are the first ones on fresh database connections with cleared Django caches;
+    Postgres and OS caches are not dropped, restart Postgres for a truly cold run.
+    Warm results are checked against the budget in `api_budget.json`, the command fails when one
+    is exceeded. Seeded rows are committed (requests run on other connections) and deleted afterwards.
+    """
+    help = 'Benchmark movies API latency and queries at several catalog scales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1000,10000,100000',
+                            help='comma-separated numbers of seeded films')
+        parser.add_argument('--persons-per-film', type=int, default=20)
+        parser.add_argument('--genres-per-film', type=int, default=3)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Warm requests per scenario')
+        parser.add_argument('--budget', default=BUDGET_PATH)
+        parser.add_argument('--write-budget', action='store_true',
+                            help='Store the warm results as the new budget instead of checking it')
+        parser.add_argument('--headroom', type=float, default=1.5,
+                            help='With --write-budget, allowed growth of latency and response size')
+
+    def handle(self, *args, **options):
+        scales = sorted(int(value) for value in options['scales'].split(','))
+        self.stdout.write(f'{"films":>8} {"scenario":>8} {"cache":>5} {"reqs":>5} {"p50 ms":>8} {"p95 ms":>8} '
+                          f'{"p99 ms":>8} {"queries":>7} {"sql ms":>7} {"bytes":>8}')
+        results, tags, seeded = {}, [], 0
+        try:
+            for scale in scales:
+                tags.append(uuid.uuid4().hex[:8])
+                with transaction.atomic():
+                    seed_catalog(scale - seeded, options['persons_per_film'], options['genres_per_film'],
+                                 tag=tags[-1])
+                seeded = scale
+                if has_replica() and not wait_for_replica(60):
+                    raise CommandError('The replica has not replayed the seeded catalog in 60s')
+                urls = self.scenario_urls(tags)
+                for scenario in SCENARIOS:
+                    for cache in ('cold', 'warm'):
+                        samples = self.drive(urls[scenario], cache, options['concurrency'], options['requests'])
+                        summary = self.summarize(samples)
+                        self.report(scale, scenario, cache, len(samples), summary)
+                        if cache == 'warm':
+                            results.setdefault(str(scale), {})[scenario] = summary
+        finally:
+            for tag in tags:
+                delete_catalog(tag)
+
+        if options['write_budget']:
+            self.write_budget(options['budget'], results, options['headroom'])
+            self.stdout.write(f'Budget written to {options["budget"]}')
+            return
+        exceeded = self.check_budget(options['budget'], results)
+        if exceeded:
+            raise CommandError('Performance budget exceeded:\n' + '\n'.join(exceeded))
+        self.stdout.write('Within the performance budget')
+
+    @staticmethod
+    def scenario_urls(tags: List[str]) -> Dict[str, Callable[[int], str]]:
+        """URL of the i-th request of every scenario; pages are counted over the whole catalog"""
+        pages = max(math.ceil(FilmWork.objects.count() / PAGE_SIZE), 1)
+        film_ids = [str(pk) for tag in tags for pk in
+                    FilmWork.objects.filter(title__startswith=f'Film {tag} ').values_list('id', flat=True)[:1_000]]
+        return {
+            'first': lambda i: '/api/v1/movies/?page=1',
+            'middle': lambda i: f'/api/v1/movies/?page={max(pages // 2, 1)}',
+            'deep': lambda i: f'/api/v1/movies/?page={max(pages * 9 // 10, 1)}',
+            'last': lambda i: '/api/v1/movies/?page=last',
+            'detail': lambda i: f'/api/v1/movies/{film_ids[i * 7919 % len(film_ids)]}',
+        }
+
+    def drive(self, url: Callable[[int], str], cache: str, concurrency: int, requests: int) -> List[Sample]:
+        """Run the requests in `concurrency` threads, each with its own client and database connections"""
+        if cache == 'cold':
+            for alias in caches:
+                caches[alias].clear()
+            per_thread = 1
+        else:
+            per_thread = math.ceil(requests / concurrency)
+        samples, errors = [], []
+        start = threading.Barrier(concurrency)
+
+        def worker(n: int):
+            client = Client(HTTP_HOST='localhost')
+            try:
+                if cache == 'warm':
+                    self.request(client, url(n))
+                start.wait()
+                for i in range(per_thread):
+                    samples.append(self.request(client, url(n * per_thread + i)))
+            except Exception as e:
+                errors.append(e)
+                start.abort()
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(n, )) for n in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise CommandError(f'{url(0)}: {errors[0]!r}')
+        return samples
+
+    @staticmethod
+    def request(client: Client, url: str) -> Sample:
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append((time.perf_counter() - started) * 1000)
+
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(record))
+            started = time.perf_counter()
+            response = client.get(url)
+            ms = (time.perf_counter() - started) * 1000
+        if response.status_code != 200:
+            raise CommandError(f'{url} returned {response.status_code}')
+        return Sample(ms, len(queries), sum(queries), len(response.content))
+
+    @staticmethod
+    def summarize(samples: List[Sample]) -> dict:
+        latencies = [sample.ms for sample in samples]
+        return {'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99),
+                # the worst request: a query count growing with the page is an N+1
+                'queries': max(sample.queries for sample in samples),
+                'sql_ms': sum(sample.sql_ms for sample in samples) / len(samples),
+                'bytes': max(sample.bytes for sample in samples)}
+
+    def report(self, scale: int, scenario: str, cache: str, requests: int, summary: dict):
+        self.stdout.write(f'{scale:>8} {scenario:>8} {cache:>5} {requests:>5} {summary["p50_ms"]:>8.1f} '
+                          f'{summary["p95_ms"]:>8.1f} {summary["p99_ms"]:>8.1f} {summary["queries"]:>7} '
+                          f'{summary["sql_ms"]:>7.1f} {summary["bytes"]:>8}')
+
+    @staticmethod
+    def check_budget(path: str, results: dict) -> List[str]:
+        """Budget entries exceeded by the results; scales and scenarios missing in the budget are not checked"""
+        with open(path) as f:
+            budget = json.load(f)
+        exceeded = []
+        for scale, scenarios in results.items():
+            for scenario, summary in scenarios.items():
+                for metric, limit in budget.get(scale, {}).get(scenario, {}).items():
+                    if summary[metric] > limit:
+                        exceeded.append(f'{scale} films, {scenario}: {metric} {summary[metric]:.1f} > {limit}')
+        return exceeded
+
+    @staticmethod
+    def write_budget(path: str, results: dict, headroom: float):
+        budget = {scale: {scenario: {'p95_ms': round(summary['p95_ms'] * headroom, 1),
+                                     'p99_ms': round(summary['p99_ms'] * headroom, 1),
+                                     'queries': summary['queries'],
+                                     'bytes': math.ceil(summary['bytes'] * headroom)}
+                          for scenario, summary in scenarios.items()}
+                  for scale, scenarios in results.items()}
+        with open(path, 'w') as f:
+            json.dump(budget, f, indent=2)
+            f.write('\n')
@@ -0,0 +1,55 @@
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from api.v1.views import PAGE_SIZE, MoviesListApi
+from movies.benchmarks import api_queryset, median, seed_catalog, time_call
+from movies.models import FilmWork, PersonJob
+
+
+def joined_queryset():
+    """The former API queryset: all aggregates over one genres × persons join"""
+    qs = FilmWork.objects.all().order_by('title')
+    qs = qs.values('id', 'title', 'description', 'creation_date')
+    qs = qs.annotate(rating=F('imdb_rating'), type=F('film_type'))
+    qs = qs.annotate(genres=ArrayAgg('genres__genre', distinct=True))
+    for job in PersonJob.values:
+        qs = qs.annotate(**{job + 's': ArrayAgg('persons__name', distinct=True, filter=Q(filmworkperson__job=job))})
+    return qs
+
+
+class Command(BaseCommand):
+    """
+    Compare per-page time of the movies API queryset (correlated array subqueries)
+    with the former single grouped join at different persons-per-film fan-outs.
+    Data is seeded inside a transaction that is rolled back afterwards.
+    """
+    help = 'Benchmark movies API page query time at different fan-outs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--films', type=int, default=2_000)
+        parser.add_argument('--fanouts', default='10,50,100,200',
+                            help='comma-separated persons-per-film values')
+        parser.add_argument('--genres-per-film', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        fanouts = [int(value) for value in options['fanouts'].split(',')]
+        querysets = {
+            'join': joined_queryset,
+            'subquery': lambda: api_queryset(MoviesListApi),
+        }
+        self.stdout.write(f'{"fan-out":>8} {"page":>6} ' + ' '.join(f'{name + ", ms":>14}' for name in querysets))
+        for fanout in fanouts:
+            with transaction.atomic():
+                seed_catalog(options['films'], fanout, options['genres_per_film'])
+                pages = {'first': 0, 'middle': options['films'] // 2, 'last': options['films'] - PAGE_SIZE}
+                for page, offset in pages.items():
+                    row = f'{fanout:>8} {page:>6} '
+                    for get_queryset in querysets.values():
+                        timings = time_call(lambda: list(get_queryset()[offset:offset + PAGE_SIZE]),
+                                            options['repeat'])
+                        row += f'{median(timings):>14.1f} '
+                    self.stdout.write(row)
+                transaction.set_rollback(True)
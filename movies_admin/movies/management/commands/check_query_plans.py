@@ -0,0 +1,152 @@
+import json
+import os
+from contextlib import ExitStack
+from typing import Callable, Dict, Tuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client
+
+from api.v1.views import PAGE_SIZE, MoviesDetailView, MoviesListApi
+from etl.etl import ETL
+from etl.rows import MovieRow
+from movies.benchmarks import api_queryset, seed_catalog
+from movies.models import FilmWork
+from movies.plans import PlanExpectation, check_plan, explain, plan_diff, plan_shape
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'query_plans.json')
+# every one of them looks related rows up by the film id, and entities by their primary key
+ARRAY_TABLES = ('film_work_genre', 'film_work_person', 'genre', 'person')
+# batch sizes and pages the query counts are compared at: a count growing with them is an N+1
+BATCH_SIZES = (10, 100)
+
+
+class Command(BaseCommand):
+    """
+    Guard the plans and query counts of the critical ETL and API queries.
+
+    A catalog is seeded inside a transaction that is rolled back afterwards, then:
+      * every named query is run with `EXPLAIN (ANALYZE, BUFFERS)`, its plan is checked against
+        its expectation (tables read by an index, no join multiplying its input) and
+        its shape is diffed with the stored baseline;
+      * queries per ETL batch and per API request are counted, at two batch sizes and pages.
+    Raw JSON plans are written to `--plans-dir`. The command fails on any violation, changed plan
+    or unexpected query count; `--update` stores the current plans as the baseline.
+    Run it against the primary: the API reads the replica, which does not see the seeded rows.
+    """
+    help = 'Check query plans and query counts of the ETL and API queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--films', type=int, default=10_000)
+        parser.add_argument('--persons-per-film', type=int, default=20)
+        parser.add_argument('--genres-per-film', type=int, default=3)
+        parser.add_argument('--baseline', default=BASELINE_PATH)
+        parser.add_argument('--plans-dir', default=os.path.join(settings.BASE_DIR, 'profile', 'plans'))
+        parser.add_argument('--update', action='store_true',
+                            help='Store the current plan shapes as the baseline')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            baseline = {}
+        os.makedirs(options['plans_dir'], exist_ok=True)
+        failures, shapes = [], {}
+
+        with transaction.atomic():
+            seed_catalog(options['films'], options['persons_per_film'], options['genres_per_film'])
+            film_id = FilmWork.objects.values_list('id', flat=True).first()
+
+            self.stdout.write(f'{"query":<22} {"ms":>9} {"hit":>9} {"read":>9}  problems')
+            for name, (get_queryset, expectation) in self.named_queries(film_id).items():
+                plan = explain(get_queryset())
+                with open(os.path.join(options['plans_dir'], f'{name}.json'), 'w') as f:
+                    json.dump(plan, f, indent=2)
+                problems = check_plan(plan, expectation)
+                failures += [f'{name}: {problem}' for problem in problems]
+                root = plan['Plan']
+                self.stdout.write(f'{name:<22} {plan["Execution Time"]:>9.1f} {root.get("Shared Hit Blocks", 0):>9} '
+                                  f'{root.get("Shared Read Blocks", 0):>9}  {"; ".join(problems) or "ok"}')
+
+                shapes[name] = plan_shape(root)
+                if name not in baseline:
+                    self.stdout.write(f'{name}: no baseline plan, run with --update to store it')
+                    continue
+                diff = plan_diff(name, baseline[name], shapes[name])
+                if diff and not options['update']:
+                    failures.append(f'{name}: plan changed')
+                    self.stdout.write('\n'.join(diff))
+
+            self.stdout.write(f'{"query count":<22} ' + ' '.join(f'{size:>9}' for size in BATCH_SIZES))
+            for name, (run, expected) in self.counted_operations(film_id).items():
+                counts = [self.count_queries(lambda: run(size)) for size in BATCH_SIZES]
+                self.stdout.write(f'{name:<22} ' + ' '.join(f'{count:>9}' for count in counts))
+                if len(set(counts)) > 1:
+                    failures.append(f'{name}: query count grows with the batch: {counts}')
+                elif expected is not None and counts[0] > expected:
+                    failures.append(f'{name}: {counts[0]} queries, expected at most {expected}')
+            transaction.set_rollback(True)
+
+        if options['update']:
+            with open(options['baseline'], 'w') as f:
+                json.dump({**baseline, **shapes}, f, indent=2, ensure_ascii=False)
+                f.write('\n')
+            self.stdout.write(f'Baseline written to {options["baseline"]}')
+        if failures:
+            raise CommandError('Query regressions:\n' + '\n'.join(failures))
+        self.stdout.write('Plans and query counts are as expected')
+
+    @staticmethod
+    def named_queries(film_id) -> Dict[str, Tuple[Callable, PlanExpectation]]:
+        """Querysets of the critical queries as the ETL and the API run them"""
+        etl = ETL(batch_size=settings.ETL_BATCH_SIZE)
+        batch = slice(0, etl.batch_size)
+        deep_offset = FilmWork.objects.count() * 9 // 10
+        deep = slice(deep_offset, deep_offset + PAGE_SIZE)
+        return {
+            # the aggregated extraction joins persons with genres by design: up to genres per film times its rows
+            'etl.movies': (lambda: etl.updated_movies_queryset().values_list(*MovieRow._fields)[batch],
+                           PlanExpectation(max_join_fanout=None)),
+            'etl.persons': (lambda: etl.updated_persons_queryset().values_list('id', 'name', 'last_modified')[batch],
+                            PlanExpectation(no_seq_scan=('film_work_person', ))),
+            'etl.genres': (lambda: etl.updated_genres_queryset().values_list('id', 'genre', 'last_modified')[batch],
+                           PlanExpectation()),
+            'api.list': (lambda: api_queryset(MoviesListApi)[:PAGE_SIZE],
+                         PlanExpectation(no_seq_scan=ARRAY_TABLES)),
+            'api.list_deep': (lambda: api_queryset(MoviesListApi)[deep],
+                              PlanExpectation(no_seq_scan=ARRAY_TABLES)),
+            'api.detail': (lambda: api_queryset(MoviesDetailView).filter(pk=film_id),
+                           PlanExpectation(no_seq_scan=('film_work', ) + ARRAY_TABLES)),
+        }
+
+    @staticmethod
+    def counted_operations(film_id) -> Dict[str, Tuple[Callable[[int], object], int]]:
+        """Operations with the most queries they may run, None if only the growth is checked"""
+        client = Client(HTTP_HOST='localhost')
+        return {
+            'etl.movies': (lambda size: ETL(batch_size=size).get_updated_movies(), 1),
+            'etl.movies_normalized': (
+                lambda size: ETL(batch_size=size, movies_extraction='normalized').get_updated_movies(), None),
+            'etl.persons': (lambda size: ETL(batch_size=size).get_updated_perons(), 2),
+            'etl.genres': (lambda size: ETL(batch_size=size).get_updated_genres(), 2),
+            # the first page, then a page deeper in the catalog
+            'api.list': (lambda size: client.get(f'/api/v1/movies/?page={1 if size == BATCH_SIZES[0] else "last"}'),
+                         2),
+            'api.detail': (lambda size: client.get(f'/api/v1/movies/{film_id}'), 1),
+        }
+
+    @staticmethod
+    def count_queries(func: Callable) -> int:
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(record))
+            func()
+        return len(queries)
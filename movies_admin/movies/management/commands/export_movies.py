@@ -0,0 +1,37 @@
+import sys
+
+from django.core.exceptions import BadRequest
+from django.core.management.base import BaseCommand, CommandError
+
+from api.v1.export import ndjson_stream
+from api.v1.views import MoviesApiMixin
+from movies.models import FilmWork
+
+
+class Command(BaseCommand):
+    """
+    Export the whole catalog as NDJSON, same documents as `/api/v1/movies/export`
+    """
+    help = 'Stream all film works as NDJSON to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help='file path, `-` for stdout')
+        parser.add_argument('--gzip', action='store_true', help='gzip-compress the output')
+        parser.add_argument('--fields', default='', help='comma-separated API fields, all by default')
+
+    def handle(self, *args, **options):
+        try:
+            fields = MoviesApiMixin.parse_fields(options['fields'])
+        except BadRequest as e:
+            raise CommandError(e)
+        qs = MoviesApiMixin.annotate_fields(FilmWork.objects.all(), fields)
+        if options['output'] == '-':
+            self._write(qs, sys.stdout.buffer, options['gzip'])
+        else:
+            with open(options['output'], 'wb') as f:
+                self._write(qs, f, options['gzip'])
+
+    @staticmethod
+    def _write(qs, f, compress):
+        for chunk in ndjson_stream(qs, compress):
+            f.write(chunk)
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.workload import DEFAULT_MIX, ChangeWorkload, parse_mix
+
+
+def add_workload_arguments(parser):
+    parser.add_argument('--changes', type=int, default=1_000)
+    parser.add_argument('--rate', type=float, default=0,
+                        help='Changes per second, 0 is as fast as possible')
+    parser.add_argument('--skew', type=float, default=1.1,
+                        help='Zipf exponent of the popularity of renamed and relinked persons and genres')
+    parser.add_argument('--popular', type=int, default=10_000,
+                        help='Most popular persons the renames and relinks are drawn from')
+    parser.add_argument('--mix', default=','.join(f'{change}={weight}' for change, weight in DEFAULT_MIX.items()),
+                        help='Weights of the changes')
+    parser.add_argument('--seed', type=int)
+
+
+def workload_from_options(options, tag: str = None) -> ChangeWorkload:
+    try:
+        mix = parse_mix(options['mix'])
+    except ValueError as e:
+        raise CommandError(e)
+    return ChangeWorkload(mix, options['skew'], options['popular'], options['seed'], tag)
+
+
+class Command(BaseCommand):
+    """
+    Apply a stream of film edits, renames, relinks and deletes to the existing catalog,
+    or with `--tag` to a catalog seeded by a benchmark, see `movies.workload`.
+    Changes are committed and are NOT rolled back
+    """
+    help = 'Generate a change workload for the incremental ETL'
+
+    def add_arguments(self, parser):
+        add_workload_arguments(parser)
+        parser.add_argument('--tag', help='Change only the catalog seeded with this tag')
+
+    def handle(self, *args, **options):
+        made = workload_from_options(options, options['tag']).run(options['changes'], options['rate'])
+        for change, count in sorted(made.items()):
+            self.stdout.write(f'{change:<14} {count:>8}')
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.3 on 2026-10-19 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0011_auto_20210605_1800'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filmwork',
+            index=models.Index(fields=['film_type', 'title'], name='film_work_film_ty_5701e9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmwork',
+            index=models.Index(fields=['imdb_rating'], name='film_work_imdb_ra_078d62_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmworkgenre',
+            index=models.Index(fields=['genre', 'film_work'], name='film_work_g_genre_i_cc953b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmworkperson',
+            index=models.Index(fields=['person', 'job', 'film_work'], name='film_work_p_person__714fc5_idx'),
+        ),
+    ]
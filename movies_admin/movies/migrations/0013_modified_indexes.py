@@ -0,0 +1,33 @@
+# Generated by Django 3.2.3 on 2026-10-19 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0012_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='filmwork',
+            index=models.Index(fields=['modified'], name='film_work_modifie_1a6953_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmworkgenre',
+            index=models.Index(fields=['genre', 'modified'], name='film_work_g_genre_i_6d0e27_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='filmworkperson',
+            index=models.Index(fields=['person', 'modified'], name='film_work_p_person__6ee4dd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='genre',
+            index=models.Index(fields=['modified'], name='genre_modifie_148664_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['modified'], name='person_modifie_471683_idx'),
+        ),
+    ]
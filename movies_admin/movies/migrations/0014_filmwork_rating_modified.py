@@ -0,0 +1,20 @@
+# Generated by Django 3.2.3 on 2026-10-19 07:43
+
+import datetime
+from django.db import migrations
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0013_modified_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filmwork',
+            name='rating_modified',
+            field=model_utils.fields.MonitorField(default=datetime.datetime(2020, 1, 1, 0, 0), editable=False, monitor='imdb_rating', verbose_name='дата изменения рейтинга'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# Changes the ETL cannot see from `modified` columns of existing rows:
+# a deleted relation or film leaves no row behind, and `QuerySet.update()` skips `MonitorField`.
+# Statement-level triggers touch the entities whose documents change, once per statement.
+FORWARD = """
+CREATE FUNCTION film_work_rating_modified() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.rating_modified := clock_timestamp();
+    RETURN NEW;
+END $$;
+CREATE TRIGGER film_work_rating_modified BEFORE UPDATE OF imdb_rating ON film_work
+    FOR EACH ROW WHEN (OLD.imdb_rating IS DISTINCT FROM NEW.imdb_rating)
+    EXECUTE FUNCTION film_work_rating_modified();
+
+CREATE FUNCTION film_work_genre_deleted() RETURNS trigger LANGUAGE plpgsql SET search_path FROM CURRENT AS $$
+BEGIN
+    UPDATE genre SET modified = clock_timestamp() WHERE id IN (SELECT genre_id FROM deleted);
+    UPDATE film_work SET modified = clock_timestamp() WHERE id IN (SELECT film_work_id FROM deleted);
+    RETURN NULL;
+END $$;
+CREATE TRIGGER film_work_genre_deleted AFTER DELETE ON film_work_genre
+    REFERENCING OLD TABLE AS deleted FOR EACH STATEMENT EXECUTE FUNCTION film_work_genre_deleted();
+
+CREATE FUNCTION film_work_person_deleted() RETURNS trigger LANGUAGE plpgsql SET search_path FROM CURRENT AS $$
+BEGIN
+    UPDATE person SET modified = clock_timestamp() WHERE id IN (SELECT person_id FROM deleted);
+    UPDATE film_work SET modified = clock_timestamp() WHERE id IN (SELECT film_work_id FROM deleted);
+    RETURN NULL;
+END $$;
+CREATE TRIGGER film_work_person_deleted AFTER DELETE ON film_work_person
+    REFERENCING OLD TABLE AS deleted FOR EACH STATEMENT EXECUTE FUNCTION film_work_person_deleted();
+
+-- relation rows may outlive the film until the end of the transaction: foreign keys are deferred
+CREATE FUNCTION film_work_deleted() RETURNS trigger LANGUAGE plpgsql SET search_path FROM CURRENT AS $$
+BEGIN
+    UPDATE genre SET modified = clock_timestamp()
+        WHERE id IN (SELECT genre_id FROM film_work_genre WHERE film_work_id IN (SELECT id FROM deleted));
+    UPDATE person SET modified = clock_timestamp()
+        WHERE id IN (SELECT person_id FROM film_work_person WHERE film_work_id IN (SELECT id FROM deleted));
+    RETURN NULL;
+END $$;
+CREATE TRIGGER film_work_deleted AFTER DELETE ON film_work
+    REFERENCING OLD TABLE AS deleted FOR EACH STATEMENT EXECUTE FUNCTION film_work_deleted();
+"""
+
+BACKWARD = """
+DROP TRIGGER film_work_deleted ON film_work;
+DROP FUNCTION film_work_deleted();
+DROP TRIGGER film_work_person_deleted ON film_work_person;
+DROP FUNCTION film_work_person_deleted();
+DROP TRIGGER film_work_genre_deleted ON film_work_genre;
+DROP FUNCTION film_work_genre_deleted();
+DROP TRIGGER film_work_rating_modified ON film_work;
+DROP FUNCTION film_work_rating_modified();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0014_filmwork_rating_modified'),
+    ]
+
+    operations = [
+        migrations.RunSQL(FORWARD, BACKWARD),
+    ]
@@ -3,6 +3,7 @@ from datetime import datetime
 
 from django.db import models
 from django.utils.translation import gettext_lazy as _
+from model_utils.fields import MonitorField
 from model_utils.models import TimeStampedModel
 
 # This datetime must be definitely older than the project
@@ -38,6 +39,7 @@ class Person(TimeStampedModel):
         verbose_name_plural = _('люди')
         indexes = (
             models.Index(fields=('name', )),
+            models.Index(fields=('modified', )),
         )
 
     def __str__(self):
@@ -59,6 +61,7 @@ class Genre(TimeStampedModel):
         verbose_name_plural = _('жанры')
         indexes = (
             models.Index(fields=('genre', )),
+            models.Index(fields=('modified', )),
         )
 
     def __str__(self):
@@ -82,7 +85,10 @@ class FilmWork(TimeStampedModel):
     persons = models.ManyToManyField(Person, through='FilmWorkPerson')
     film_type = models.CharField(_('тип'), max_length=32, choices=FilmWorkType.choices, blank=True, default='')
 
-    # ElasticSearch specific field
+    # ElasticSearch specific fields
+    # genre statistics depend on the rating only, so other edits of a film do not reindex its genres
+    rating_modified = MonitorField(_('дата изменения рейтинга'), monitor='imdb_rating',
+                                   default=DATETIME_ANCIENT, editable=False)
     indexed_at = models.DateTimeField(_('дата индексации в ElasticSearch'), default=DATETIME_ANCIENT, editable=False)
 
     class Meta:
@@ -92,6 +98,10 @@ class FilmWork(TimeStampedModel):
         indexes = (
             models.Index(fields=('title',)),
             models.Index(fields=('creation_date',)),
+            # API filters: `type` keeps pages in title order, `rating_min`/`rating_max` ranges
+            models.Index(fields=('film_type', 'title')),
+            models.Index(fields=('imdb_rating',)),
+            models.Index(fields=('modified',)),
         )
 
     def __str__(self):
@@ -108,6 +118,10 @@ class FilmWorkGenre(TimeStampedModel):
         db_table = 'film_work_genre'
         indexes = (
             models.Index(fields=('film_work', 'genre', )),
+            # `EXISTS` lookups of the API `genre` filter
+            models.Index(fields=('genre', 'film_work', )),
+            # ETL: latest relation change per genre, `modified` is taken from the index
+            models.Index(fields=('genre', 'modified', )),
         )
 
 
@@ -125,4 +139,8 @@ class FilmWorkPerson(TimeStampedModel):
         db_table = 'film_work_person'
         indexes = (
             models.Index(fields=('film_work', 'person', )),
+            # `EXISTS` lookups of the API `person` and `job` filters
+            models.Index(fields=('person', 'job', 'film_work', )),
+            # ETL: latest relation change per person, `modified` is taken from the index
+            models.Index(fields=('person', 'modified', )),
         )
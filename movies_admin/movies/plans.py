@@ -0,0 +1,78 @@
+"""
+Checks of Postgres query plans for `check_query_plans`.
+
+Plans are `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)` output. A plan is compared with
+a stored baseline by its shape only: node types, join types, tables and indexes, one node per line,
+so costs and timings that differ on every run do not show up in the diff.
+"""
+
+import difflib
+import json
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from django.db import connections
+
+JOIN_NODES = ('Nested Loop', 'Hash Join', 'Merge Join')
+
+
+class PlanExpectation(NamedTuple):
+    # tables that must be read by an index, never by a sequential scan
+    no_seq_scan: Tuple[str, ...] = ()
+    # largest allowed ratio of a join's estimated rows to the rows of its largest input;
+    # a join multiplying its input is a cross product of one-to-many relations
+    max_join_fanout: Optional[float] = 2.0
+
+
+def explain(qs) -> dict:
+    """Executed plan of the queryset: the `Plan` tree with `Execution Time`"""
+    # not `QuerySet.explain`: Django 3.2 returns the decoded JSON plan as a Python repr
+    sql, params = qs.query.sql_with_params()
+    with connections[qs.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]
+
+
+def walk(node: dict) -> Iterator[dict]:
+    yield node
+    for child in node.get('Plans', ()):
+        yield from walk(child)
+
+
+def plan_shape(node: dict, depth: int = 0) -> List[str]:
+    """Indented node lines without numbers"""
+    label = node['Node Type']
+    if node.get('Join Type') and node['Node Type'] in JOIN_NODES:
+        label = f'{node["Join Type"]} {label}'
+    if node.get('Strategy'):
+        label += f' ({node["Strategy"]})'
+    if node.get('Index Name'):
+        label += f' using {node["Index Name"]}'
+    if node.get('Relation Name'):
+        label += f' on {node["Relation Name"]}'
+    if node.get('Subplan Name'):
+        label = f'{node["Subplan Name"]}: {label}'
+    lines = ['  ' * depth + label]
+    for child in node.get('Plans', ()):
+        lines += plan_shape(child, depth + 1)
+    return lines
+
+
+def check_plan(plan: dict, expectation: PlanExpectation) -> List[str]:
+    """Violations of `expectation` by the plan"""
+    problems = []
+    for node in walk(plan['Plan']):
+        if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in expectation.no_seq_scan:
+            problems.append(f'sequential scan on {node["Relation Name"]}')
+        if node['Node Type'] in JOIN_NODES and expectation.max_join_fanout is not None:
+            largest_input = max((child['Plan Rows'] for child in node.get('Plans', ())), default=0)
+            fanout = node['Plan Rows'] / max(largest_input, 1)
+            if fanout > expectation.max_join_fanout:
+                problems.append(f'{node["Node Type"]} estimated at {node["Plan Rows"]} rows '
+                                f'from {largest_input}: ×{fanout:.1f} > ×{expectation.max_join_fanout}')
+    return problems
+
+
+def plan_diff(name: str, baseline: List[str], shape: List[str]) -> List[str]:
+    """Unified diff of plan shapes, empty if the plan did not change"""
+    return list(difflib.unified_diff(baseline, shape, f'{name} (baseline)', f'{name} (now)', lineterm=''))
@@ -0,0 +1,54 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from etl.etl import ETL
+from movies.benchmarks import seed_catalog
+from movies.management.commands.check_query_plans import BATCH_SIZES, Command
+from movies.plans import check_plan, explain
+
+
+class QueryRegressionTests(TestCase):
+    """Query counts and plans guarded by `check_query_plans`, on a small seeded catalog"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.films = seed_catalog(films=300, persons_per_film=5, genres_per_film=2, persons=200, genres=10)
+
+    def test_etl_query_counts(self):
+        for size in BATCH_SIZES:
+            with self.subTest(batch_size=size):
+                with self.assertNumQueries(1):
+                    self.assertEqual(len(ETL(batch_size=size).get_updated_movies()), size)
+                with self.assertNumQueries(2):
+                    self.assertEqual(len(ETL(batch_size=size).get_updated_perons()), size)
+                with self.assertNumQueries(2):
+                    ETL(batch_size=size).get_updated_genres()
+
+    def test_api_query_counts(self):
+        for page in ('1', '2', 'last'):
+            with self.subTest(page=page), self.assertNumQueries(2):
+                response = self.client.get(f'/api/v1/movies/?page={page}')
+                self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/v1/movies/{self.films[0].pk}')
+            self.assertEqual(response.status_code, 200)
+
+    def test_query_plans(self):
+        # the tables are tiny: make the planner take an index wherever there is one
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, (get_queryset, expectation) in Command.named_queries(self.films[0].pk).items():
+            with self.subTest(query=name):
+                self.assertEqual(check_plan(explain(get_queryset()), expectation), [])
+
+
+class BenchmarkCommandTests(TestCase):
+    """Benchmark commands still run against the current API and ETL code"""
+
+    def test_bench_api_fanout(self):
+        out = StringIO()
+        call_command('bench_api_fanout', films=60, fanouts='2', genres_per_film=1, repeat=1, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)  # the header and three pages
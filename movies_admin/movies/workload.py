@@ -0,0 +1,168 @@
+"""
+Synthetic change workload against an existing catalog, for benchmarking the incremental ETL.
+
+Every change is one committed write, made the way the admin makes it (model `save`/`delete`):
+    edit           title, description or rating of a random film
+    rename_person  rename of a person picked by popularity, reindexes all of their films
+    rename_genre   rename of a genre picked by popularity, reindexes all of its films
+    relink         a film's person relation pointed to another (popular) person
+    delete         a random film deleted with its relations
+Popular entities are drawn from a Zipf distribution over the ranks by film count:
+rank k is picked with probability ∝ 1 / k ** skew, so a higher skew concentrates the renames
+on the few entities with the largest fan-out.
+Deleted films are not followed by the incremental ETL, `reconcile_es` removes their documents.
+With a `tag` only the catalog seeded with it by `movies.benchmarks.seed_catalog` is changed;
+renames keep the seeded name prefixes, so `delete_catalog(tag)` still removes everything.
+"""
+
+import itertools
+import random
+import re
+import time
+import uuid
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+
+from movies.models import FilmWork, FilmWorkGenre, FilmWorkPerson, Genre, Person
+
+CHANGES = ('edit', 'rename_person', 'rename_genre', 'relink', 'delete')
+DEFAULT_MIX = {'edit': 50, 'rename_person': 10, 'rename_genre': 2, 'relink': 30, 'delete': 8}
+# marker appended by renames, replaced by the next rename of the same entity
+RENAME_MARKER = re.compile(r' \[w\d+\]$')
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Change weights from `edit=5,relink=2`; changes not mentioned are not made"""
+    mix = {}
+    for item in value.split(','):
+        change, _, weight = item.partition('=')
+        if change.strip() not in CHANGES:
+            raise ValueError(f'Unknown change {change!r}, choose from {", ".join(CHANGES)}')
+        mix[change.strip()] = float(weight or 1)
+    return mix
+
+
+class Zipf:
+    """Picks items by rank, rank k (from 1) with probability ∝ 1 / k ** skew"""
+
+    def __init__(self, items: List, skew: float, rng: random.Random):
+        self.items = items
+        self.rng = rng
+        self.cum_weights = list(itertools.accumulate(1 / rank ** skew for rank in range(1, len(items) + 1)))
+
+    def __call__(self):
+        if not self.items:
+            return None
+        return self.items[bisect_left(self.cum_weights, self.rng.random() * self.cum_weights[-1])]
+
+
+class ChangeWorkload:
+    """
+    Replays a mix of changes at a given rate; `popular` limits the ranked persons to the top ones,
+    `tag` limits all changes to a seeded catalog
+    """
+
+    def __init__(self, mix: Dict[str, float] = None, skew: float = 1.1, popular: int = 10_000,
+                 seed: Optional[int] = None, tag: Optional[str] = None):
+        self.mix = mix or DEFAULT_MIX
+        self.rng = random.Random(seed)
+        self.counter = itertools.count(1)
+        # ids of the deleted films, the incremental ETL leaves their documents in the index
+        self.deleted = []
+        self.films = FilmWork.objects.all()
+        persons, genres = Person.objects.all(), Genre.objects.all()
+        if tag:
+            self.films = self.films.filter(title__startswith=f'Film {tag} ')
+            persons = persons.filter(name__startswith=f'Person {tag} ')
+            genres = genres.filter(genre__startswith=f'genre-{tag}-')
+        persons = persons.annotate(films=Count('filmworkperson')).order_by('-films')
+        genres = genres.annotate(films=Count('filmworkgenre')).order_by('-films')
+        self.popular_person = Zipf(list(persons.values_list('id', flat=True)[:popular]), skew, self.rng)
+        self.popular_genre = Zipf(list(genres.values_list('id', flat=True)), skew, self.rng)
+
+    def run(self, changes: int, rate: float = 0) -> Counter:
+        """Make `changes` changes, `rate` per second at most (0 is as fast as possible); return counts made"""
+        made = Counter()
+        kinds, weights = zip(*self.mix.items())
+        started = time.monotonic()
+        for i in range(changes):
+            if rate:
+                delay = started + i / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            kind = self.rng.choices(kinds, weights)[0]
+            if getattr(self, kind)():
+                made[kind] += 1
+            else:
+                made['skipped'] += 1
+        return made
+
+    def random_film(self) -> Optional[FilmWork]:
+        """Uniformly random film: the first one from a random uuid on, an index scan"""
+        after = self.films.filter(pk__gte=uuid.UUID(int=self.rng.getrandbits(128))).order_by('pk')
+        return after.first() or self.films.order_by('pk').first()
+
+    def renamed(self, name: str, max_length: Optional[int] = None) -> str:
+        marker = f' [w{next(self.counter)}]'
+        base = RENAME_MARKER.sub('', name)
+        return base[:max_length - len(marker) if max_length else None] + marker
+
+    def edit(self) -> bool:
+        film = self.random_film()
+        if film is None:
+            return False
+        field = self.rng.choice(('title', 'description', 'imdb_rating'))
+        if field == 'title':
+            film.title = self.renamed(film.title, FilmWork._meta.get_field('title').max_length)
+        elif field == 'description':
+            film.description = self.renamed(film.description).strip()
+        else:
+            film.imdb_rating = round(self.rng.uniform(0, 10), 1)
+        film.save()
+        return True
+
+    def rename_person(self) -> bool:
+        person = Person.objects.filter(pk=self.popular_person()).first()
+        if person is None:
+            return False
+        person.name = self.renamed(person.name)
+        person.save()
+        return True
+
+    def rename_genre(self) -> bool:
+        genre = Genre.objects.filter(pk=self.popular_genre()).first()
+        if genre is None:
+            return False
+        genre.genre = self.renamed(genre.genre, Genre._meta.get_field('genre').max_length)
+        try:
+            with transaction.atomic():
+                genre.save()
+        except IntegrityError:  # unique name taken
+            return False
+        return True
+
+    def relink(self) -> bool:
+        film = self.random_film()
+        relation = film and FilmWorkPerson.objects.filter(film_work=film).order_by('?').first()
+        person_id = self.popular_person()
+        if not relation or person_id is None or relation.person_id == person_id:
+            return False
+        relation.person_id = person_id
+        relation.save()
+        return True
+
+    def delete(self) -> bool:
+        film = self.random_film()
+        if film is None:
+            return False
+        # relations are DO_NOTHING foreign keys
+        with transaction.atomic():
+            FilmWorkPerson.objects.filter(film_work=film).delete()
+            FilmWorkGenre.objects.filter(film_work=film).delete()
+            film.delete()
+        self.deleted.append(film.pk)
+        return True
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""
+Standalone ETL runner for cron and other short frequent runs.
+
+Unlike `manage.py start_etl` it boots Django with `config.settings.etl`:
+only the ORM models and the `etl` app are loaded, no web settings are required.
+"""
+import time
+
+STARTED = time.perf_counter()
+
+import argparse  # noqa: E402
+import logging  # noqa: E402
+import os  # noqa: E402
+
+logger = logging.getLogger('etl.run')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--spool', action='store_true',
+                        help='Write documents to the on-disk spool, load them with `drain_spool`')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.etl')
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from etl.etl import ETL
+    from etl.spool import Spool
+
+    logger.info(f'ETL runner started in {(time.perf_counter() - STARTED) * 1000:.0f} ms')
+    spool = Spool(settings.ETL_SPOOL_DIR, settings.ETL_SPOOL_SEGMENT_SIZE) if args.spool else None
+    ETL(spool=spool).start()
+    logger.info(f'ETL run finished in {time.perf_counter() - STARTED:.2f} s')
+
+
+if __name__ == '__main__':
+    main()